@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+
+# KMHXcodeTools
+# pbxproj_benchmark.py
+# Ken M. Haggerty
+# VERSION : 1.0
+# CREATED : 2026 Oct 18
+# EDITED  : 2026 Oct 18
+
+########## CODE ##########
+
+##### Imports #####
+
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pbxproj_organizer
+
+##### Generator #####
+
+### Constants
+
+PBXBenchmarkSourceExtensions = [".swift", ".m", ".mm", ".c"]
+PBXBenchmarkResourceExtensions = [".png", ".storyboard", ".xib", ".json", ".strings"]
+PBXBenchmarkHeaderExtensions = [".h"]
+PBXBenchmarkFileTypes = {
+    ".swift" : "sourcecode.swift",
+    ".m" : "sourcecode.c.objc",
+    ".mm" : "sourcecode.cpp.objcpp",
+    ".c" : "sourcecode.c.c",
+    ".h" : "sourcecode.c.h",
+    ".png" : "image.png",
+    ".storyboard" : "file.storyboard",
+    ".xib" : "file.xib",
+    ".json" : "text.json",
+    ".strings" : "text.plist.strings"
+}
+PBXBenchmarkPhases = ["Sources", "Resources", "Frameworks"]
+PBXBenchmarkFrameworks = ["UIKit", "Foundation", "CoreData", "CoreGraphics", "QuartzCore", "AVFoundation", "MapKit", "Security"]
+
+### Functions
+
+def generateObjectId(generator):
+    return "%024X" % generator.getrandbits(96)
+
+def generatePBXProj(files=1000, depth=4, targets=2, phases=PBXBenchmarkPhases, seed=0, shuffle=True):
+    generator = random.Random(seed)
+    newId = lambda: generateObjectId(generator)
+    objects = {}
+
+    def add(isa, objectId, comment, lines):
+        objects.setdefault(isa, []).append((objectId, comment, lines))
+
+    def shuffled(items):
+        items = list(items)
+        if shuffle:
+            generator.shuffle(items)
+        return items
+
+    # Groups and file references
+
+    mainGroup = newId()
+    groups = {mainGroup : [None, []]}
+    levels = [(mainGroup, 0)]
+    fileRefs = []
+    for i in range(files):
+        group, level = levels[generator.randrange(len(levels))]
+        if level < depth and generator.random() < 0.1:
+            subgroup = newId()
+            groups[subgroup] = ["Group%d" % len(groups), []]
+            groups[group][1].append(subgroup)
+            levels.append((subgroup, level + 1))
+            group = subgroup
+        extension = generator.choice(PBXBenchmarkSourceExtensions + PBXBenchmarkResourceExtensions + PBXBenchmarkHeaderExtensions)
+        fileRef = newId()
+        fileRefs.append((fileRef, "File%d%s" % (i, extension), extension))
+        groups[group][1].append(fileRef)
+    frameworksGroup = newId()
+    productsGroup = newId()
+    frameworkRefs = [(newId(), name + ".framework") for name in PBXBenchmarkFrameworks]
+    groups[frameworksGroup] = ["Frameworks", [fileRef for fileRef, name in frameworkRefs]]
+    groups[productsGroup] = ["Products", []]
+    groups[mainGroup][1].extend([frameworksGroup, productsGroup])
+    names = dict((fileRef, name) for fileRef, name, extension in fileRefs)
+    names.update(frameworkRefs)
+
+    # Targets
+
+    buildFiles = []
+    targetIds = []
+    for t in range(targets):
+        targetName = "Target%d" % t
+        product = newId()
+        groups[productsGroup][1].append(product)
+        names[product] = targetName + ".app"
+        add("PBXFileReference", product, targetName + ".app", "{isa = PBXFileReference; explicitFileType = wrapper.application; includeInIndex = 0; path = %s.app; sourceTree = BUILT_PRODUCTS_DIR; };" % targetName)
+        phaseFiles = dict((phase, []) for phase in phases)
+        for fileRef, name, extension in fileRefs:
+            if extension in PBXBenchmarkSourceExtensions:
+                phase = "Sources"
+            elif extension in PBXBenchmarkResourceExtensions:
+                phase = "Resources"
+            else:
+                continue
+            if phase in phaseFiles and (t == 0 or generator.random() < 0.5):
+                buildFile = newId()
+                buildFiles.append((buildFile, fileRef, name, phase))
+                phaseFiles[phase].append((buildFile, name))
+        if "Frameworks" in phaseFiles:
+            for fileRef, name in generator.sample(frameworkRefs, min(3, len(frameworkRefs))):
+                buildFile = newId()
+                buildFiles.append((buildFile, fileRef, name, "Frameworks"))
+                phaseFiles["Frameworks"].append((buildFile, name))
+        phaseIds = []
+        for phase in phases:
+            phaseId = newId()
+            phaseIds.append((phaseId, phase))
+            lines = ["{", "\tisa = PBX%sBuildPhase;" % phase, "\tbuildActionMask = 2147483647;", "\tfiles = ("]
+            for buildFile, name in shuffled(phaseFiles[phase]):
+                lines.append("\t\t%s /* %s in %s */," % (buildFile, name, phase))
+            lines.extend(["\t);", "\trunOnlyForDeploymentPostprocessing = 0;", "};"])
+            add("PBX%sBuildPhase" % phase, phaseId, phase, lines)
+        configurations = []
+        for configuration in ["Debug", "Release"]:
+            configurationId = newId()
+            configurations.append((configurationId, configuration))
+            add("XCBuildConfiguration", configurationId, configuration, ["{", "\tisa = XCBuildConfiguration;", "\tbuildSettings = {", "\t\tPRODUCT_BUNDLE_IDENTIFIER = com.example.%s;" % targetName, "\t\tPRODUCT_NAME = \"$(TARGET_NAME)\";", "\t};", "\tname = %s;" % configuration, "};"])
+        configurationList = newId()
+        comment = "Build configuration list for PBXNativeTarget \"%s\"" % targetName
+        lines = ["{", "\tisa = XCConfigurationList;", "\tbuildConfigurations = ("]
+        lines.extend("\t\t%s /* %s */," % configuration for configuration in configurations)
+        lines.extend(["\t);", "\tdefaultConfigurationIsVisible = 0;", "\tdefaultConfigurationName = Release;", "};"])
+        add("XCConfigurationList", configurationList, comment, lines)
+        target = newId()
+        targetIds.append((target, targetName))
+        lines = ["{", "\tisa = PBXNativeTarget;", "\tbuildConfigurationList = %s /* %s */;" % (configurationList, comment), "\tbuildPhases = ("]
+        lines.extend("\t\t%s /* %s */," % phase for phase in phaseIds)
+        lines.extend(["\t);", "\tbuildRules = (", "\t);", "\tdependencies = (", "\t);", "\tname = %s;" % targetName, "\tproductName = %s;" % targetName, "\tproductReference = %s /* %s.app */;" % (product, targetName), "\tproductType = \"com.apple.product-type.application\";", "};"])
+        add("PBXNativeTarget", target, targetName, lines)
+
+    for buildFile, fileRef, name, phase in buildFiles:
+        add("PBXBuildFile", buildFile, "%s in %s" % (name, phase), "{isa = PBXBuildFile; fileRef = %s /* %s */; };" % (fileRef, name))
+    for fileRef, name, extension in fileRefs:
+        add("PBXFileReference", fileRef, name, "{isa = PBXFileReference; lastKnownFileType = %s; path = %s; sourceTree = \"<group>\"; };" % (PBXBenchmarkFileTypes[extension], name))
+    for fileRef, name in frameworkRefs:
+        add("PBXFileReference", fileRef, name, "{isa = PBXFileReference; lastKnownFileType = wrapper.framework; name = %s; path = System/Library/Frameworks/%s; sourceTree = SDKROOT; };" % (name, name))
+    for group, (name, children) in groups.items():
+        lines = ["{", "\tisa = PBXGroup;", "\tchildren = ("]
+        lines.extend("\t\t%s /* %s */," % (child, groups[child][0] if child in groups else names[child]) for child in children)
+        lines.append("\t);")
+        if name is not None and name not in ["Frameworks", "Products"]:
+            lines.append("\tpath = %s;" % name)
+        elif name is not None:
+            lines.append("\tname = %s;" % name)
+        lines.extend(["\tsourceTree = \"<group>\";", "};"])
+        add("PBXGroup", group, name, lines)
+
+    # Project
+
+    project = newId()
+    projectConfigurations = []
+    for configuration in ["Debug", "Release"]:
+        configurationId = newId()
+        projectConfigurations.append((configurationId, configuration))
+        add("XCBuildConfiguration", configurationId, configuration, ["{", "\tisa = XCBuildConfiguration;", "\tbuildSettings = {", "\t\tSDKROOT = iphoneos;", "\t};", "\tname = %s;" % configuration, "};"])
+    projectConfigurationList = newId()
+    comment = "Build configuration list for PBXProject \"Benchmark\""
+    lines = ["{", "\tisa = XCConfigurationList;", "\tbuildConfigurations = ("]
+    lines.extend("\t\t%s /* %s */," % configuration for configuration in projectConfigurations)
+    lines.extend(["\t);", "\tdefaultConfigurationIsVisible = 0;", "\tdefaultConfigurationName = Release;", "};"])
+    add("XCConfigurationList", projectConfigurationList, comment, lines)
+    lines = ["{", "\tisa = PBXProject;", "\tbuildConfigurationList = %s /* %s */;" % (projectConfigurationList, comment), "\tcompatibilityVersion = \"Xcode 3.2\";", "\tdevelopmentRegion = English;", "\thasScannedForEncodings = 0;", "\tmainGroup = %s;" % mainGroup, "\tproductRefGroup = %s /* Products */;" % productsGroup, "\tprojectDirPath = \"\";", "\tprojectRoot = \"\";", "\ttargets = ("]
+    lines.extend("\t\t%s /* %s */," % target for target in targetIds)
+    lines.extend(["\t);", "};"])
+    add("PBXProject", project, "Project object", lines)
+
+    # Text
+
+    pieces = ["// !$*UTF8*$!\n{\n\tarchiveVersion = 1;\n\tclasses = {\n\t};\n\tobjectVersion = 46;\n\tobjects = {\n"]
+    for isa in sorted(objects):
+        pieces.append("\n/* Begin %s section */\n" % isa)
+        for objectId, comment, lines in shuffled(objects[isa]):
+            head = objectId if comment is None else "%s /* %s */" % (objectId, comment)
+            if isinstance(lines, str):
+                lines = [lines]
+            pieces.append("\t\t%s = %s\n" % (head, lines[0] + "".join("\n\t\t" + line for line in lines[1:])))
+        pieces.append("/* End %s section */\n" % isa)
+    pieces.append("\t};\n\trootObject = %s /* Project object */;\n}\n" % project)
+    return "".join(pieces)
+
+##### Benchmark #####
+
+### Constants
+
+PBXBenchmarkRSSScript = """
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+import pbxproj_organizer
+def peakRSS():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+baseline = peakRSS()
+pbxproj_organizer.organizeProject(sys.argv[2], {pbxproj_organizer.PBXProjOptionStreamKey : sys.argv[3] == "stream", pbxproj_organizer.PBXProjOptionCacheKey : False})
+print(baseline, peakRSS())
+"""
+PBXBenchmarkRSSUnit = 1 if sys.platform == "darwin" else 1024
+# PBXBenchmarkRSSScript = Organize one project in a fresh interpreter, in memory or streaming, and print its peak RSS before and after
+# PBXBenchmarkRSSUnit = Peak RSS is in bytes on macOS and in kilobytes elsewhere
+# Linux children inherit ru_maxrss from the parent across fork, so VmHWM is preferred where /proc exists
+
+### Functions
+
+def runStages(text):
+    timings = {}
+    def hook(stage):
+        name = stage[pbxproj_organizer.PBXStageNameKey]
+        timings[name] = timings.get(name, 0.0) + stage[pbxproj_organizer.PBXStageDurationKey]
+    pbxproj_organizer.organizePBXProj(text, {pbxproj_organizer.PBXProjOptionStageHookKey : hook})
+    return timings
+
+def measurePeakMemory(text):
+    tracemalloc.start()
+    try:
+        pbxproj_organizer.organizePBXProj(text)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def measurePeakRSS(text, stream=False):
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, pbxproj_organizer.PBXProjFilename), "w") as file:
+            file.write(text)
+        script = os.path.dirname(os.path.abspath(pbxproj_organizer.__file__))
+        output = subprocess.run([sys.executable, "-c", PBXBenchmarkRSSScript, script, directory, "stream" if stream else "memory"], stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    finally:
+        shutil.rmtree(directory)
+    baseline, peak = [int(value) * PBXBenchmarkRSSUnit for value in output.split()]
+    return {"baseline" : baseline, "peak" : peak}
+
+def benchmarkPBXProj(text, repeat=3):
+    runs = [runStages(text) for i in range(repeat)]
+    stages = {}
+    for stage in runs[0]:
+        samples = sorted(run[stage] for run in runs)
+        stages[stage] = {
+            "median" : samples[len(samples) // 2],
+            "min" : samples[0],
+            "max" : samples[-1]
+        }
+    total = sorted(sum(run.values()) for run in runs)
+    return {
+        "bytes" : len(text.encode("utf-8")),
+        "stages" : stages,
+        "total" : total[len(total) // 2],
+        "peakMemory" : measurePeakMemory(text),
+        "peakRSS" : measurePeakRSS(text),
+        "peakRSSStream" : measurePeakRSS(text, True)
+    }
+
+##### Startup #####
+
+### Constants
+
+PBXBenchmarkStartupForbiddenModules = ["concurrent.futures", "glob", "multiprocessing", "subprocess", "tempfile", "xml.etree.ElementTree"]
+PBXBenchmarkStartupLimit = 100.0
+PBXBenchmarkStartupSlowest = 10
+
+### Regexes
+
+PBXBenchmarkImportTimeRegex = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$', re.M)
+
+### Functions
+
+def timeCommand(command, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000.0
+
+def measureStartup(repeat=10):
+    script = os.path.abspath(pbxproj_organizer.__file__)
+    directory = tempfile.mkdtemp()
+    try:
+        command = [sys.executable, script, "--no-cache", directory]
+        output = subprocess.run([sys.executable, "-X", "importtime"] + command[1:], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+        python = timeCommand([sys.executable, "-c", "pass"], repeat)
+        organizer = timeCommand(command, repeat)
+    finally:
+        shutil.rmtree(directory)
+    modules = [(int(match.group(1)), match.group(4)) for match in PBXBenchmarkImportTimeRegex.finditer(output)]
+    names = set(module for duration, module in modules)
+    return {
+        "python" : python,
+        "organizer" : organizer,
+        "overhead" : organizer - python,
+        "modules" : len(modules),
+        "slowest" : [{"module" : module, "self" : duration / 1000.0} for duration, module in sorted(modules, reverse=True)[:PBXBenchmarkStartupSlowest]],
+        "forbidden" : sorted(names.intersection(PBXBenchmarkStartupForbiddenModules))
+    }
+
+########## SCRIPT ##########
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark pbxproj_organizer.py on synthetic project.pbxproj files.")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000], help="number of file references per generated project")
+    parser.add_argument("--depth", type=int, default=4, help="maximum group depth")
+    parser.add_argument("--targets", type=int, default=4, help="number of targets")
+    parser.add_argument("--phases", nargs="+", default=PBXBenchmarkPhases, choices=PBXBenchmarkPhases, help="build phases per target")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generator")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per project")
+    parser.add_argument("--output", default="pbxproj_benchmark.json", help="write results to this JSON file ('-' for stdout)")
+    parser.add_argument("--save-project", metavar="DIR", help="also write each generated project.pbxproj into DIR")
+    parser.add_argument("--startup", action="store_true", help="only measure CLI start-up time and imports; exit non-zero on a regression")
+    parser.add_argument("--startup-limit", type=float, default=PBXBenchmarkStartupLimit, metavar="MS", help="maximum start-up overhead over a bare interpreter in milliseconds (default: %(default)s)")
+    arguments = parser.parse_args(argv)
+
+    results = {
+        "organizerVersion" : pbxproj_organizer.PBXProjOrganizerVersion,
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "created" : time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "cases" : []
+    }
+    status = 0
+    if arguments.startup:
+        startup = measureStartup(max(arguments.repeat, 10))
+        results["startup"] = startup
+        sys.stderr.write("startup %6.1f ms  python %6.1f ms  overhead %6.1f ms  %d modules\n" % (startup["organizer"], startup["python"], startup["overhead"], startup["modules"]))
+        for module in startup["slowest"]:
+            sys.stderr.write("  %7.2f ms  %s\n" % (module["self"], module["module"]))
+        if startup["forbidden"]:
+            sys.stderr.write("startup imports %s\n" % ", ".join(startup["forbidden"]))
+            status = 1
+        if startup["overhead"] > arguments.startup_limit:
+            sys.stderr.write("startup overhead exceeds %.1f ms\n" % arguments.startup_limit)
+            status = 1
+    for files in ([] if arguments.startup else arguments.files):
+        text = generatePBXProj(files, arguments.depth, arguments.targets, arguments.phases, arguments.seed)
+        if arguments.save_project:
+            path = os.path.join(arguments.save_project, "Benchmark%d.xcodeproj" % files)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            with open(os.path.join(path, pbxproj_organizer.PBXProjFilename), "w") as file:
+                file.write(text)
+        result = benchmarkPBXProj(text, arguments.repeat)
+        result["parameters"] = {
+            "files" : files,
+            "depth" : arguments.depth,
+            "targets" : arguments.targets,
+            "phases" : arguments.phases,
+            "seed" : arguments.seed
+        }
+        results["cases"].append(result)
+        sys.stderr.write("%7d files  %9d bytes  %8.3fs  %7.1f MB peak  %7.1f MB RSS  %7.1f MB RSS streaming\n" % (files, result["bytes"], result["total"], result["peakMemory"] / 1048576.0, result["peakRSS"]["peak"] / 1048576.0, result["peakRSSStream"]["peak"] / 1048576.0))
+
+    if arguments.output == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
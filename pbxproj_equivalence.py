@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+# KMHXcodeTools
+# pbxproj_equivalence.py
+# Ken M. Haggerty
+# VERSION : 1.0
+# CREATED : 2026 Oct 18
+# EDITED  : 2026 Oct 18
+
+########## CODE ##########
+
+##### Imports #####
+
+import copy
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+
+import pbxproj_benchmark
+import pbxproj_organizer
+
+##### Legacy #####
+
+### Constants
+
+PBXLegacyVersion = "1.2"
+PBXLegacyFilename = "pbxproj_organizer.py"
+PBXLegacyScriptMarker = "########## SCRIPT ##########"
+PBXLegacyUpdates = [
+    "updatePBXBuildFileSection",
+    "updatePBXFileReferenceSection",
+    "updatePBXFrameworksBuildPhaseSection",
+    "updatePBXGroupSection",
+    "updatePBXResourcesBuildPhaseSection",
+    "updatePBXSourcesBuildPhaseSection"
+]
+# PBXLegacyVersion = Last release of the regex-based organizer
+# PBXLegacyUpdates = Section updates in the order the legacy script ran them
+
+### Functions
+
+def findLegacyRevision(version=PBXLegacyVersion):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    marker = "# VERSION : " + version
+    revision = subprocess.run(["git", "log", "-1", "--format=%H", "-S" + marker, "--", PBXLegacyFilename], cwd=directory, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.strip()
+    if not revision:
+        raise ValueError("No commit removes '%s' from %s; pass --legacy" % (marker, PBXLegacyFilename))
+    return revision + "^"
+
+def readLegacySource(source=None):
+    if source is None:
+        source = findLegacyRevision() + ":" + PBXLegacyFilename
+    if os.path.isfile(source):
+        with open(source) as file:
+            return file.read()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.run(["git", "show", source], cwd=directory, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+
+def loadLegacyOrganizer(source):
+    code = source.split(PBXLegacyScriptMarker)[0]
+    legacy = {"__name__" : "pbxproj_organizer_legacy"}
+    exec(compile(code, "legacy " + PBXLegacyFilename, "exec"), legacy)
+    return legacy
+
+def organizeLegacyText(legacy, text):
+    order = legacy["processPBXProjOrder"](text)
+    for update in PBXLegacyUpdates:
+        text = legacy[update](text, order)
+    return text
+
+##### Corpus #####
+
+### Constants
+
+PBXCorpusShuffledKeys = [pbxproj_organizer.PBXGroupSectionChildrenKey, pbxproj_organizer.PBXBuildPhaseFilesKey]
+# Lists a mutation shuffles, besides the objects of every section
+
+PBXCorpusEditAttempts = 100
+# Random pairs of objects an edit tries before it gives up on a kind of swap
+
+### Functions
+
+def mutatePBXProj(text, seed):
+    generator = random.Random(seed)
+    sections = pbxproj_organizer.indexPBXProjSections(text)
+    pbxproj_organizer.parsePBXProj(text, sections)
+    for section in sections.values():
+        objects = section[pbxproj_organizer.PBXSectionObjectsKey]
+        generator.shuffle(objects)
+        for object in objects:
+            for key in PBXCorpusShuffledKeys:
+                generator.shuffle(object[pbxproj_organizer.PBXObjectItemsKey].get(key, []))
+    return pbxproj_organizer.serializePBXProj(text, sections)
+
+def editPBXProjSection(text, name, seed):
+    generator = random.Random(seed)
+    sections = pbxproj_organizer.indexPBXProjSections(text)
+    section = sections[name]
+    objects = pbxproj_organizer.parsePBXProj(text, sections, [name])
+    replacements = []
+    objects = list(objects.values())
+    pairs = [generator.sample(objects, 2) for i in range(PBXCorpusEditAttempts)] if len(objects) > 1 else []
+    for first, second in pairs:
+        keys = [key for key, value in first[pbxproj_organizer.PBXObjectValueKey].items() if isinstance(value, str) and key != pbxproj_organizer.PBXObjectIsaKey and isinstance(second[pbxproj_organizer.PBXObjectValueKey].get(key), str) and value != second[pbxproj_organizer.PBXObjectValueKey][key]]
+        if keys:
+            key = generator.choice(sorted(keys))
+            matches = [re.compile(r"\b%s = %s(?:\s*\/\*.*?\*\/)?(?=\s*;)" % (re.escape(key), re.escape(object[pbxproj_organizer.PBXObjectValueKey][key]))).search(text, object[pbxproj_organizer.PBXObjectStartKey], object[pbxproj_organizer.PBXObjectEndKey]) for object in [first, second]]
+            if matches[0] and matches[1]:
+                replacements.append((matches[0].start(), matches[0].end(), matches[1].group(0)))
+                replacements.append((matches[1].start(), matches[1].end(), matches[0].group(0)))
+                break
+    for first, second in pairs:
+        keys = [key for key in first[pbxproj_organizer.PBXObjectItemsKey] if first[pbxproj_organizer.PBXObjectItemsKey][key] and second[pbxproj_organizer.PBXObjectItemsKey].get(key)]
+        if keys:
+            key = generator.choice(sorted(keys))
+            firstSpan = generator.choice(first[pbxproj_organizer.PBXObjectItemsKey][key])
+            secondSpan = generator.choice(second[pbxproj_organizer.PBXObjectItemsKey][key])
+            replacements.append((firstSpan[0], firstSpan[1], text[secondSpan[0]:secondSpan[1]]))
+            replacements.append((secondSpan[0], secondSpan[1], text[firstSpan[0]:firstSpan[1]]))
+            break
+    pieces = []
+    position = 0
+    for start, end, replacement in sorted(replacements):
+        if start < position:
+            continue
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+def shufflePBXProjSection(text, name, seed):
+    generator = random.Random(seed)
+    sections = pbxproj_organizer.indexPBXProjSections(text)
+    section = sections[name]
+    pbxproj_organizer.parsePBXProj(text, sections, [name])
+    generator.shuffle(section[pbxproj_organizer.PBXSectionObjectsKey])
+    for object in section[pbxproj_organizer.PBXSectionObjectsKey]:
+        for key in PBXCorpusShuffledKeys:
+            generator.shuffle(object[pbxproj_organizer.PBXObjectItemsKey].get(key, []))
+    return "".join(pbxproj_organizer.assemblePBXProj(text, {name : section}, {name : pbxproj_organizer.serializePBXProjSection(text, section)}))
+
+def generateCorpus(sizes, targets, seeds, mutations, projects=()):
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample Project", "KMHXcodeTools.xcodeproj")
+    bases = []
+    for project in [sample] + list(projects):
+        bases.append((os.path.basename(os.path.normpath(project)), pbxproj_organizer.readPBXProjFile(os.path.join(project, pbxproj_organizer.PBXProjFilename))))
+    for files in sizes:
+        for count in targets:
+            for seed in seeds:
+                bases.append(("generated-%d-%dt-%d" % (files, count, seed), pbxproj_benchmark.generatePBXProj(files, 4, count, pbxproj_benchmark.PBXBenchmarkPhases, seed)))
+    for name, text in bases:
+        yield name, text
+        for mutation in range(mutations):
+            yield "%s~%d" % (name, mutation), mutatePBXProj(text, mutation)
+
+##### Comparison #####
+
+### Constants
+
+PBXDifferenceUnorganized = "unorganized"
+PBXDifferenceReordered = "reordered"
+PBXDifferenceContent = "content"
+PBXDifferenceFrame = "frame"
+# unorganized = Legacy left the section as it was
+# reordered = Same lines in another order
+# content = Different lines
+# frame = Text outside the sections differs
+
+PBXIncrementalEdits = [shufflePBXProjSection, editPBXProjSection]
+# Single-section edits after which a cached run must match a full pass
+# shufflePBXProjSection = Objects and lists of the section in a random order
+# editPBXProjSection = Swap a value and a list item between two objects of the section
+
+### Functions
+
+def sectionLines(text, sections, name):
+    if name not in sections:
+        return None
+    return pbxproj_organizer.sectionBody(text, sections[name]).splitlines()
+
+def frameText(text, sections):
+    return "".join(pbxproj_organizer.assemblePBXProj(text, sections, dict((name, "") for name in sections)))
+
+def compareSection(original, legacy, organized):
+    if legacy == organized:
+        return None
+    firstDifference = 0
+    while firstDifference < min(len(legacy or []), len(organized or [])) and legacy[firstDifference] == organized[firstDifference]:
+        firstDifference += 1
+    if legacy == original:
+        kind = PBXDifferenceUnorganized
+    elif legacy is not None and organized is not None and sorted(legacy) == sorted(organized):
+        kind = PBXDifferenceReordered
+    else:
+        kind = PBXDifferenceContent
+    return {
+        "kind" : kind,
+        "firstDifference" : firstDifference,
+        "legacyLines" : len(legacy or []),
+        "organizerLines" : len(organized or [])
+    }
+
+def checkOrganizer(text, organized):
+    errors = []
+    sections = pbxproj_organizer.indexPBXProjSections(text)
+    organizedSections = pbxproj_organizer.indexPBXProjSections(organized)
+    if sorted(sections) != sorted(organizedSections) or frameText(text, sections) != frameText(organized, organizedSections):
+        errors.append("sections or the text around them changed")
+    for name in sections:
+        if sorted(sectionLines(text, sections, name)) != sorted(sectionLines(organized, organizedSections, name) or []):
+            errors.append("%s is not a permutation of its lines" % name)
+    if pbxproj_organizer.organizeText(organized) != organized:
+        errors.append("organizing again changes the output")
+    return errors
+
+def checkIncremental(text, seed=0):
+    errors = []
+    slices = {}
+    organized = pbxproj_organizer.organizeText(text, {pbxproj_organizer.PBXProjOptionSlicesKey : slices})
+    sections = pbxproj_organizer.indexPBXProjSections(organized)
+    names = sorted(pbxproj_organizer.hashPBXProjSections(organized, sections))
+    edits = 0
+    for name in names:
+        for edit in PBXIncrementalEdits:
+            edited = edit(organized, name, seed)
+            if edited == organized:
+                continue
+            edits += 1
+            full = pbxproj_organizer.organizeText(edited)
+            cached = pbxproj_organizer.organizeText(edited, {pbxproj_organizer.PBXProjOptionSlicesKey : copy.deepcopy(slices)})
+            if cached != full:
+                errors.append("cached run after %s of %s differs from a full pass" % (edit.__name__, name))
+            unorganized = pbxproj_organizer.checkPBXProj(edited)
+            if pbxproj_organizer.checkPBXProj(edited, {pbxproj_organizer.PBXProjOptionSlicesKey : copy.deepcopy(slices)}) != unorganized:
+                errors.append("cached check after %s of %s differs from a full check" % (edit.__name__, name))
+    return edits, errors
+
+def timeOrganizer(organize, text, repeat):
+    durations = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        output = organize(text)
+        durations.append(time.perf_counter() - start)
+    return output, min(durations)
+
+def compareOrganizers(legacy, name, text, repeat=1, incremental=True):
+    result = {
+        "name" : name,
+        "bytes" : len(text.encode(pbxproj_organizer.PBXProjEncoding, pbxproj_organizer.PBXProjEncodingErrors)),
+        "differences" : {},
+        "errors" : []
+    }
+    try:
+        organized, result["organizer"] = timeOrganizer(pbxproj_organizer.organizeText, text, repeat)
+    except Exception as error:
+        result["errors"].append("organizer failed: %s" % error)
+        return result
+    result["errors"].extend(checkOrganizer(text, organized))
+    if incremental:
+        result["edits"], errors = checkIncremental(text)
+        result["errors"].extend(errors)
+    try:
+        legacyText, result["legacy"] = timeOrganizer(lambda x: organizeLegacyText(legacy, x), text, repeat)
+    except Exception as error:
+        result["legacyError"] = str(error) or error.__class__.__name__
+        return result
+    result["identical"] = legacyText == organized
+    result["speedup"] = result["legacy"] / max(result["organizer"], 1e-9)
+    sections = pbxproj_organizer.indexPBXProjSections(text)
+    legacySections = pbxproj_organizer.indexPBXProjSections(legacyText)
+    organizedSections = pbxproj_organizer.indexPBXProjSections(organized)
+    for section in sorted(set(sections) | set(legacySections) | set(organizedSections)):
+        difference = compareSection(sectionLines(text, sections, section), sectionLines(legacyText, legacySections, section), sectionLines(organized, organizedSections, section))
+        if difference is not None:
+            result["differences"][section] = difference
+    if frameText(legacyText, legacySections) != frameText(organized, organizedSections):
+        result["differences"][""] = {"kind" : PBXDifferenceFrame}
+    return result
+
+def summarizeComparisons(results):
+    summary = {
+        "cases" : len(results),
+        "identical" : len([result for result in results if result.get("identical")]),
+        "errors" : sum(len(result["errors"]) for result in results),
+        "legacyErrors" : len([result for result in results if "legacyError" in result]),
+        "differences" : {}
+    }
+    timed = [result for result in results if "legacy" in result]
+    if timed:
+        summary["speedup"] = sum(result["legacy"] for result in timed) / max(sum(result["organizer"] for result in timed), 1e-9)
+    for result in results:
+        for section, difference in result["differences"].items():
+            counts = summary["differences"].setdefault(section, {})
+            counts[difference["kind"]] = counts.get(difference["kind"], 0) + 1
+    return summary
+
+########## SCRIPT ##########
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare pbxproj_organizer.py with the legacy regex-based organizer on a corpus of project.pbxproj files.")
+    parser.add_argument("projects", nargs="*", help="additional .xcodeproj bundles to include in the corpus")
+    parser.add_argument("--legacy", metavar="SOURCE", help="legacy pbxproj_organizer.py, as a file or a git REV:PATH (default: the last %s release in git history)" % PBXLegacyVersion)
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000], help="file references per generated project")
+    parser.add_argument("--targets", type=int, nargs="+", default=[1, 2], help="targets per generated project")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1], help="random seeds for generated projects")
+    parser.add_argument("--mutations", type=int, default=2, help="shuffled variants of every project in the corpus")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per organizer and project")
+    parser.add_argument("--no-incremental", action="store_true", help="skip checking cached runs against full passes after single-section edits")
+    parser.add_argument("--strict", action="store_true", help="also exit non-zero when the output differs from the legacy organizer")
+    parser.add_argument("--output", default="pbxproj_equivalence.json", help="write results to this JSON file ('-' for stdout)")
+    arguments = parser.parse_args(argv)
+
+    legacy = loadLegacyOrganizer(readLegacySource(arguments.legacy))
+    results = []
+    for name, text in generateCorpus(arguments.files, arguments.targets, arguments.seeds, arguments.mutations, arguments.projects):
+        result = compareOrganizers(legacy, name, text, arguments.repeat, not arguments.no_incremental)
+        results.append(result)
+        if "legacyError" in result:
+            outcome = "legacy failed: " + result["legacyError"]
+        elif result.get("identical"):
+            outcome = "identical"
+        else:
+            outcome = ", ".join("%s %s" % (section or "frame", difference["kind"]) for section, difference in sorted(result["differences"].items()))
+        speedup = "%6.1fx" % result["speedup"] if "speedup" in result else "      -"
+        sys.stderr.write("%-28s %9d bytes  %s  %s\n" % (name, result["bytes"], speedup, outcome))
+        for error in result["errors"]:
+            sys.stderr.write("%-28s error: %s\n" % (name, error))
+
+    summary = summarizeComparisons(results)
+    sys.stderr.write("%d cases, %d identical, %d errors, %.1fx faster than legacy\n" % (summary["cases"], summary["identical"], summary["errors"], summary.get("speedup", 0.0)))
+    report = {
+        "organizerVersion" : pbxproj_organizer.PBXProjOrganizerVersion,
+        "legacyVersion" : PBXLegacyVersion,
+        "summary" : summary,
+        "cases" : results
+    }
+    if arguments.output == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if summary["errors"] > 0:
+        return 1
+    if arguments.strict and summary["identical"] < summary["cases"]:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,399 +3,2126 @@
 # KMHXcodeTools
 # pbxproj_organizer.py
 # Ken M. Haggerty
-# VERSION : 1.2
+# VERSION : 1.3
 # CREATED : 2017 Mar 09
-# EDITED  : 2019 May 14
+# EDITED  : 2026 Oct 18
 
 ########## CODE ##########
 
 ##### Imports #####
 
+import bisect
+import hashlib
+import json
+import os
 import re
+import stat
+import sys
+import time
 
 ##### Shared #####
 
 ### Constants
 
+PBXProjOrganizerVersion = "1.3"
+
+PBXProjEncoding = "utf-8"
+PBXProjEncodingErrors = "surrogateescape"
+# surrogateescape = Round-trip any bytes that are not valid UTF-8
+
+PBXProjEncodingChunk = 1 << 20
+# PBXProjEncodingChunk = Characters encoded at a time when hashing or writing, so a large section is never copied whole
+
 PBXGroupSectionChildrenKey = "children"
-PBXGroupSectionIdKey = "fileRef"
-PBXBuildSectionIdKey = "id"
+PBXBuildFileSectionFileRefKey = "fileRef"
 
-### Regexes
+### Section Markers
 
-PBXSectionRegex_1 = r"(^[\S\s]*)(\/\*\s*Begin\s+"
-PBXSectionRegex_2 = r"\s+section\s*\*\/s*[^\n]*\n)([\S\s]*)(\n\s*\/\*\s*End\s+"
-PBXSectionRegex_3 = r"\s+section\s*\*\/s*[^\n]*)([\S\s]*$)"
-# 1 = Beginning of file
-# 2 = PBXSection header
-# 3 = PBXSection body
-# 4 = PBXSection footer
-# 5 = End of file
+PBXSectionBeginMarker = "/* Begin "
+PBXSectionEndMarker = "/* End "
+PBXSectionMarkerSuffix = " section */"
+
+PBXSectionStartKey = "start"
+PBXSectionBodyStartKey = "bodyStart"
+PBXSectionBodyEndKey = "bodyEnd"
+PBXSectionEndKey = "end"
+# start = PBXSection header
+# bodyStart = PBXSection body (after the header line)
+# bodyEnd = PBXSection footer (newline before the End marker)
+# end = End of PBXSection footer
 
 ### Functions
 
-def generateSectionRegex(section):
-    return PBXSectionRegex_1 + section + PBXSectionRegex_2 + section + PBXSectionRegex_3
+def indexPBXProjSections(text):
+    sections = {}
+    position = text.find(PBXSectionBeginMarker)
+    while position != -1:
+        nameStart = position + len(PBXSectionBeginMarker)
+        nameEnd = text.find(PBXSectionMarkerSuffix, nameStart)
+        if nameEnd == -1:
+            break
+        name = text[nameStart:nameEnd]
+        bodyStart = text.find("\n", nameEnd) + 1
+        endMarker = PBXSectionEndMarker + name + PBXSectionMarkerSuffix
+        footer = text.find(endMarker, bodyStart) if bodyStart > 0 else -1
+        if footer == -1:
+            break
+        bodyEnd = max(text.rfind("\n", bodyStart, footer), bodyStart)
+        end = footer + len(endMarker)
+        sections[name] = {
+            PBXSectionStartKey : position,
+            PBXSectionBodyStartKey : bodyStart,
+            PBXSectionBodyEndKey : bodyEnd,
+            PBXSectionEndKey : end
+        }
+        position = text.find(PBXSectionBeginMarker, end)
+    return sections
+
+def sectionBody(text, section):
+    return text[section[PBXSectionBodyStartKey]:section[PBXSectionBodyEndKey]]
+
+def assemblePBXProj(text, sections, bodies):
+    pieces = []
+    position = 0
+    for name in sorted(bodies, key=lambda x: sections[x][PBXSectionBodyStartKey]):
+        section = sections[name]
+        pieces.append(text[position:section[PBXSectionBodyStartKey]])
+        pieces.append(bodies[name])
+        position = section[PBXSectionBodyEndKey]
+    pieces.append(text[position:])
+    return pieces
+
+def encodePBXProj(pieces):
+    for piece in pieces:
+        for start in range(0, len(piece), PBXProjEncodingChunk):
+            yield piece[start:start + PBXProjEncodingChunk].encode(PBXProjEncoding, PBXProjEncodingErrors)
+
+def hashPBXProj(pieces):
+    digest = hashlib.sha1()
+    for data in encodePBXProj(pieces):
+        digest.update(data)
+    return digest.hexdigest()
+
+def sectionObjects(sections, name):
+    if name in sections:
+        return sections[name].get(PBXSectionObjectsKey, [])
+    return []
 
 def sortElements(elements, order):
-    orderCopy = list(order)
-    sortedArray = []
-    while len(orderCopy) > 0:
-        item = orderCopy.pop(0)
-        fileRef = item[PBXGroupSectionIdKey]
-        if PBXGroupSectionChildrenKey in item:
-            orderCopy = item[PBXGroupSectionChildrenKey] + orderCopy
-        if fileRef in elements:
-            value = elements[fileRef]
-            sortedArray.append(value)
-        elif PBXBuildSectionIdKey in item:
-            buildId = item[PBXBuildSectionIdKey]
-            if buildId in elements:
-                value = elements[buildId]
-                sortedArray.append(value)
-    return sortedArray
+    unranked = len(order)
+    elements = sorted(elements, key=lambda x: order.get(x[0], unranked))
+    return [value for key, value in elements]
+
+def countMoves(elements, order):
+    unranked = len(order)
+    tails = []
+    for key, value in elements:
+        rank = order.get(key, unranked)
+        index = bisect.bisect_right(tails, rank)
+        if index == len(tails):
+            tails.append(rank)
+        else:
+            tails[index] = rank
+    return len(elements) - len(tails)
+
+##### Profiling #####
 
-##### PBXProj Order #####
+### Constants
+
+PBXStageNameKey = "name"
+PBXStageProjectKey = "project"
+PBXStageProcessKey = "pid"
+PBXStageStartKey = "start"
+PBXStageDurationKey = "duration"
+PBXStageBytesKey = "bytes"
+PBXStageCountKey = "count"
+# name = Stage name (usually the function that ran)
+# project = Project being organized (if any)
+# pid = Process that ran the stage
+# start = Start time (time.perf_counter seconds)
+# duration = Wall time (seconds)
+# bytes = Size of the text the stage processed
+# count = Number of elements (sections, objects, IDs, slices) the stage processed
+
+### Functions
+
+def reportStage(hook, name, start, bytes, count):
+    if hook is None:
+        return
+    hook({
+        PBXStageNameKey : name,
+        PBXStageProcessKey : os.getpid(),
+        PBXStageStartKey : start,
+        PBXStageDurationKey : time.perf_counter() - start,
+        PBXStageBytesKey : bytes,
+        PBXStageCountKey : count
+    })
+
+def formatStages(stages):
+    lines = []
+    for stage in stages:
+        lines.append("  %-40s %10.3f ms %12d bytes %9d elements" % (stage[PBXStageNameKey], stage[PBXStageDurationKey] * 1000, stage[PBXStageBytesKey], stage[PBXStageCountKey]))
+    return lines
+
+def generateChromeTrace(stages):
+    events = []
+    for stage in stages:
+        events.append({
+            "name" : stage[PBXStageNameKey],
+            "cat" : "pbxproj",
+            "ph" : "X",
+            "ts" : stage[PBXStageStartKey] * 1000000,
+            "dur" : stage[PBXStageDurationKey] * 1000000,
+            "pid" : stage[PBXStageProcessKey],
+            "tid" : 0,
+            "args" : {
+                PBXStageProjectKey : stage.get(PBXStageProjectKey),
+                PBXStageBytesKey : stage[PBXStageBytesKey],
+                PBXStageCountKey : stage[PBXStageCountKey]
+            }
+        })
+    return {
+        "traceEvents" : events,
+        "displayTimeUnit" : "ms"
+    }
+
+##### PBXProj Parser #####
 
 ### Constants
 
-PBXGroupSectionNameKey = "name" # temp
+PBXObjectIdKey = "id"
+PBXObjectIsaKey = "isa"
+PBXObjectStartKey = "start"
+PBXObjectEndKey = "end"
+PBXObjectValueKey = "value"
+PBXObjectItemsKey = "items"
+PBXObjectBlockKey = "block"
+# id = PBXObject ID
+# isa = PBXObject isa
+# start = Start of PBXObject (ID)
+# end = End of PBXObject (semicolon)
+# value = PBXObject dictionary
+# items = PBXObject array item spans, by key
+# block = Block the object was reused from
+# Objects reused from unchanged blocks have an empty value and items, and a block
+
+PBXSectionObjectsKey = "objects"
+
+PBXPunctuation = "{}()=;,"
+
+PBXProjScanWindow = 1 << 18
+# PBXProjScanWindow = Characters tokenized at a time; an object cut off by the end of a window is parsed again from the next one
+
+PBXProjJoinChunk = 1 << 12
+# PBXProjJoinChunk = Pieces joined at a time when serializing a section, so its pieces never outnumber a chunk
+
+### Classes
+
+class PBXProjRecord(object):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+class PBXObjectSpan(PBXProjRecord):
+    __slots__ = (PBXObjectIdKey, PBXObjectStartKey, PBXObjectEndKey)
+
+    def __init__(self, objectId, start, end):
+        self.id = objectId
+        self.start = start
+        self.end = end
+
+class PBXObjectValue(PBXProjRecord):
+    __slots__ = (PBXObjectIdKey, PBXObjectStartKey, PBXObjectEndKey, PBXObjectValueKey)
+
+    def __init__(self, objectId, start, end, value):
+        self.id = objectId
+        self.start = start
+        self.end = end
+        self.value = value
+
+# PBXProjRecord = Read-only object record with a slot per PBXObject key, read like the dictionary it replaces
+# PBXObjectSpan = Object that is only moved, without its value or items
+# PBXObjectValue = Object that is read and moved whole, without its items
 
 ### Regexes
 
-PBXGroupSectionGroupRegex = r"(^|\n)([^\n\w]*(\w*)\s*(\/\*\s*(.*)\s*\*\/)?\s*=\s*(\{[^\}]*\})\s*;[^\n]*)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXGroupSection fileRef
-# 4 = (unused)
-# 5 = PBXGroupSection name # temp
-# 6 = PBXGroupSection dictionary
-
-PBXGroupSectionChildrenRegex = r"children\s*=\s*\(([^\)\;]*)\)\;"
-# 1 = PBXGroup children
-
-PBXGroupSectionChildRegex = r"(^|\n)(\s*(\w*)\s*(\/\*\s*((\S+.*\.\S+)|\S+[^\*\/]*).*\*\/)\s*,[^\n]*)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXGroupSection child fileRef
-# 4 = PBXGroupSection name and directory # temp
-# 5 = PBXGroupSection name # temp
-# 6 = (unused)
-
-PBXBuildFileSectionLineRegex = r"(^|\n)\s*(\w*).*=\s*\{.*fileRef\s*=\s*(\w+).*\};"
-# 1 = (start of file / newline)
-# 2 = PBXBuildFile ID
-# 3 = PBXBuildFile fileRef
+PBXTokenRegex = re.compile(r"((?:\s+|\/\*[^*]*\*+(?:[^\/*][^*]*\*+)*\/|\/\/[^\n]*)*)(?:(\"[^\"\\]*(?:\\[\S\s][^\"\\]*)*\"|[{}()=;,]|(?:[^\s\"{}()=;,\/]|\/(?![\*\/]))[^\s\"{}()=;,\/]*(?:\/(?![\*\/])[^\s\"{}()=;,\/]*)*)|(\S)|$)")
+# 1 = Trivia (whitespace / comments)
+# 2 = PBXProj token (quoted string / punctuation / unquoted string), empty at the end
+# 3 = Invalid character (unterminated string or comment)
+
+PBXObjectBoundaryRegex = re.compile(r"\n(?=\t\t[^\s}])")
+# Line that starts an object in Xcode's formatting, where a scan window can end
 
 ### Functions
 
-def processPBXProjOrder(text):
-    PBXGroupSectionRegex = generateSectionRegex("PBXGroup")
-    pbxGroupSectionBody = re.search(PBXGroupSectionRegex, text).group(3)
-    pbxGroupSections = re.findall(PBXGroupSectionGroupRegex, pbxGroupSectionBody)
-    PBXBuildFileSectionRegex = generateSectionRegex("PBXBuildFile");
-    pbxBuildFileSectionBody = re.search(PBXBuildFileSectionRegex, text).group(3)
-    pbxBuildFileSectionLines = re.findall(PBXBuildFileSectionLineRegex, pbxBuildFileSectionBody)
-    fileRefDictionary = {}
-    for line in pbxBuildFileSectionLines:
-        fileRef = line[2]
-        fileId = line[1]
-        fileRefDictionary[fileRef] = fileId
-    elements = {}
-    parentIds = set([])
+def scanPBXProjTokens(text, start, end):
+    return PBXTokenRegex.findall(text, start, end)
+
+def unexpectedPBXProjToken(token, start):
+    trivia, value, invalid = token
+    if value or invalid:
+        return ValueError("Unexpected '%s' at offset %d" % (value or invalid, start))
+    return ValueError("Unexpected end of pbxproj at offset %d" % start)
+
+def expectPBXProjToken(tokens, index, position, expected):
+    trivia, value, invalid = tokens[index]
+    if value != expected:
+        raise ValueError("Expected '%s' at offset %d" % (expected, position + len(trivia)))
+    return index + 1, position + len(trivia) + len(value)
+
+def parsePBXProjValue(tokens, index, position):
+    stack = []
+    items = {}
+    while True:
+        token = tokens[index]
+        value = token[1]
+        start = position + len(token[0])
+        position = start + len(value)
+        index += 1
+        if value == "{":
+            stack.append([{}, None, start, None])
+            value = None
+        elif value == "(":
+            stack.append([[], None, start, []])
+            value = None
+        elif len(value) == 0 or value in PBXPunctuation:
+            raise unexpectedPBXProjToken(token, start)
+        elif value[0] != '"':
+            value = sys.intern(value)
+        while True:
+            if value is not None:
+                if not stack:
+                    return value, index, position, items
+                parent = stack[-1]
+                if parent[3] is None:
+                    parent[0][parent[1]] = value
+                    index, position = expectPBXProjToken(tokens, index, position, ";")
+                else:
+                    parent[0].append(value)
+                    trivia, separator, invalid = tokens[index]
+                    if separator == ",":
+                        index += 1
+                        position += len(trivia) + 1
+                    elif separator != ")":
+                        raise ValueError("Expected ',' at offset %d" % (position + len(trivia)))
+                    if len(stack) == 2 and stack[0][3] is None:
+                        parent[3].append((start, position))
+                value = None
+            parent = stack[-1]
+            token = tokens[index]
+            if parent[3] is None:
+                key = token[1]
+                keyStart = position + len(token[0])
+                index += 1
+                position = keyStart + len(key)
+                if key == "}":
+                    value, start = stack.pop()[0:3:2]
+                    continue
+                if len(key) == 0 or key in PBXPunctuation:
+                    raise unexpectedPBXProjToken(token, keyStart)
+                parent[1] = sys.intern(key)
+                index, position = expectPBXProjToken(tokens, index, position, "=")
+                break
+            if token[1] == ")":
+                index += 1
+                position += len(token[0]) + 1
+                value, key, start, spans = stack.pop()
+                if len(stack) == 1 and stack[0][3] is None:
+                    items[stack[0][1]] = spans
+                continue
+            break
+
+def parsePBXProjObjects(text, tokens, position, end, blocks, objects):
+    index = 0
+    while tokens[index][1] or tokens[index][2]:
+        token = tokens[index]
+        objectId = token[1]
+        start = position + len(token[0])
+        if len(objectId) == 0 or objectId in PBXPunctuation:
+            raise unexpectedPBXProjToken(token, start)
+        objectId = sys.intern(objectId)
+        block = blocks.get(objectId) if blocks else None
+        if block is not None and start + block[0] <= end and hashPBXProj([text[start:start + block[0]]]) == block[1]:
+            while position < start + block[0]:
+                position += len(tokens[index][0]) + len(tokens[index][1])
+                index += 1
+            objects.append({
+                PBXObjectIdKey : objectId,
+                PBXObjectIsaKey : None,
+                PBXObjectStartKey : start,
+                PBXObjectEndKey : position,
+                PBXObjectValueKey : {},
+                PBXObjectItemsKey : {},
+                PBXObjectBlockKey : block
+            })
+            continue
+        index, position = expectPBXProjToken(tokens, index + 1, start + len(objectId), "=")
+        value, index, position, items = parsePBXProjValue(tokens, index, position)
+        index, position = expectPBXProjToken(tokens, index, position, ";")
+        objects.append({
+            PBXObjectIdKey : objectId,
+            PBXObjectIsaKey : value.get(PBXObjectIsaKey) if isinstance(value, dict) else None,
+            PBXObjectStartKey : start,
+            PBXObjectEndKey : position,
+            PBXObjectValueKey : value,
+            PBXObjectItemsKey : items
+        })
+
+def parsePBXProjSection(text, section, blocks=None, trim=None):
+    objects = []
+    position = section[PBXSectionBodyStartKey]
+    bodyEnd = section[PBXSectionBodyEndKey]
+    window = PBXProjScanWindow
+    while True:
+        boundary = PBXObjectBoundaryRegex.search(text, position + window, bodyEnd)
+        end = boundary.start() if boundary else bodyEnd
+        count = len(objects)
+        try:
+            parsePBXProjObjects(text, scanPBXProjTokens(text, position, end), position, end, blocks, objects)
+        except ValueError:
+            if end == bodyEnd:
+                raise
+        if len(objects) > count:
+            position = objects[-1][PBXObjectEndKey]
+            window = PBXProjScanWindow
+        else:
+            window *= 2
+        if trim is not None:
+            objects[count:] = [trim(object) for object in objects[count:]]
+        if end == bodyEnd:
+            return objects
+
+def parsePBXProj(text, sections, names=None, blocks=None):
+    objects = {}
+    for name, section in sections.items():
+        if names is not None and name not in names:
+            continue
+        section[PBXSectionObjectsKey] = parsePBXProjSection(text, section, (blocks or {}).get(name))
+        for object in section[PBXSectionObjectsKey]:
+            objects[object[PBXObjectIdKey]] = object
+    return objects
+
+def serializePBXProjObject(text, object):
+    items = object.get(PBXObjectItemsKey)
+    if not items:
+        return text[object[PBXObjectStartKey]:object[PBXObjectEndKey]]
+    pieces = []
+    position = object[PBXObjectStartKey]
+    for spans in items.values():
+        slots = sorted(spans)
+        if spans == slots:
+            continue
+        pieces.append(text[position:slots[0][0]])
+        for i, span in enumerate(spans):
+            if i > 0:
+                pieces.append(text[slots[i - 1][1]:slots[i][0]])
+            pieces.append(text[span[0]:span[1]])
+        position = slots[-1][1]
+    pieces.append(text[position:object[PBXObjectEndKey]])
+    return "".join(pieces)
+
+def serializePBXProjSection(text, section):
+    objects = section[PBXSectionObjectsKey]
+    if len(objects) == 0:
+        return sectionBody(text, section)
+    slots = sorted(objects, key=lambda x: x[PBXObjectStartKey])
+    chunks = []
+    pieces = [text[section[PBXSectionBodyStartKey]:slots[0][PBXObjectStartKey]]]
+    for i, object in enumerate(objects):
+        if i > 0:
+            pieces.append(text[slots[i - 1][PBXObjectEndKey]:slots[i][PBXObjectStartKey]])
+        pieces.append(serializePBXProjObject(text, object))
+        if len(pieces) >= PBXProjJoinChunk:
+            chunks.append("".join(pieces))
+            pieces = []
+    pieces.append(text[slots[-1][PBXObjectEndKey]:section[PBXSectionBodyEndKey]])
+    chunks.append("".join(pieces))
+    return "".join(chunks)
+
+def serializePBXProj(text, sections):
+    bodies = {}
+    for name, section in sections.items():
+        bodies[name] = serializePBXProjSection(text, section)
+    return "".join(assemblePBXProj(text, sections, bodies))
+
+##### PBXProj Order #####
+
+### Constants
+
+PBXGroupSectionNames = ["PBXGroup", "PBXVariantGroup"]
+
+PBXProjectTargetsKey = "targets"
+PBXObjectBuildConfigurationListKey = "buildConfigurationList"
+PBXConfigurationListBuildConfigurationsKey = "buildConfigurations"
+
+PBXObjectNameKey = "name"
+PBXObjectPathKey = "path"
+
+PBXOrderFolderIsas = ["PBXGroup", "PBXFileSystemSynchronizedRootGroup"]
+# Children that folders-first puts before files
+
+PBXProjOrderValueKeys = [PBXObjectIsaKey, PBXObjectNameKey, PBXObjectPathKey, PBXGroupSectionChildrenKey, PBXBuildFileSectionFileRefKey, PBXProjectTargetsKey, PBXObjectBuildConfigurationListKey, PBXConfigurationListBuildConfigurationsKey]
+# Object values the order functions and order strategies read
+
+### Functions
+
+def processPBXProjOrder(objects, sections, key=None):
+    children = {}
     childrenIds = set([])
-    for section in pbxGroupSections:
-        fileRef = section[2]
-        dictionary = section[5]
-        children = re.search(PBXGroupSectionChildrenRegex, dictionary).group(1)
-        children = re.findall(PBXGroupSectionChildRegex, children)
-        childDictionaries = []
-        for child in children:
-            childFileRef = child[2]
-            childName = child[4]
-            dictionary = {
-                PBXGroupSectionIdKey : childFileRef,
-                PBXGroupSectionNameKey : childName
-            }
-            try:
-                fileId = fileRefDictionary[childFileRef]
-                dictionary[PBXBuildSectionIdKey] = fileId
-            except Exception:
-                pass
-            childDictionaries.append(dictionary)
-        children = list(map(lambda x: x[2], children))
-        dictionary = {}
-        if len(childDictionaries) > 0:
-            dictionary[PBXGroupSectionChildrenKey] = childDictionaries
-        try: # temp
-            name = section[4]
-            dictionary[PBXGroupSectionNameKey] = name
-        except Exception:
-            pass
-        elements[fileRef] = dictionary
-        parentIds.update([fileRef])
-        childrenIds.update(children)
-    parents = parentIds - childrenIds
-    pbxProjOrder = []
-    for parent in parents:
-        dictionary = generateChildren(parent, elements)
-        pbxProjOrder.append(dictionary)
-    return pbxProjOrder
-
-def generateChildren(node, source):
-    dictionary = {
-        PBXGroupSectionIdKey : node
-    }
-    if PBXGroupSectionNameKey in source[node]: # temp
-        dictionary[PBXGroupSectionNameKey] = source[node][PBXGroupSectionNameKey]
-    children = source[node][PBXGroupSectionChildrenKey]
-    i = 0
-    while i < len(children):
-        child = children[i]
-        childFileRef = child[PBXGroupSectionIdKey]
-        if childFileRef in source:
-            children.pop(i)
-            grandchildren = generateChildren(childFileRef, source)
-            children.insert(i, grandchildren)
-        i += 1
-    dictionary[PBXGroupSectionChildrenKey] = children
-    return dictionary
-
-##### PBXBuildFile Section #####
+    for name in PBXGroupSectionNames:
+        for group in sectionObjects(sections, name):
+            groupChildren = group[PBXObjectValueKey].get(PBXGroupSectionChildrenKey, [])
+            if key is not None:
+                groupChildren = sorted(groupChildren, key=lambda x: key(objects.get(x, {})))
+            children[group[PBXObjectIdKey]] = groupChildren
+            childrenIds.update(groupChildren)
+    groups = sectionObjects(sections, "PBXGroup")
+    stack = [group[PBXObjectIdKey] for group in reversed(groups) if group[PBXObjectIdKey] not in childrenIds]
+    order = {}
+    while len(stack) > 0:
+        node = stack.pop()
+        if node in order:
+            continue
+        order[node] = len(order)
+        if node in children:
+            stack.extend(reversed(children[node]))
+    for object in sectionObjects(sections, "PBXBuildFile"):
+        fileRef = object[PBXObjectValueKey].get(PBXBuildFileSectionFileRefKey)
+        if fileRef in order:
+            order[object[PBXObjectIdKey]] = order[fileRef]
+    return order
+
+def processPBXProjTargetOrder(objects, sections):
+    order = {}
+    for project in sectionObjects(sections, "PBXProject"):
+        owners = [project[PBXObjectIdKey]] + project[PBXObjectValueKey].get(PBXProjectTargetsKey, [])
+        for owner in owners:
+            if owner not in order:
+                order[owner] = len(order)
+        for owner in owners:
+            if owner not in objects:
+                continue
+            configurationList = objects.get(objects[owner][PBXObjectValueKey].get(PBXObjectBuildConfigurationListKey))
+            if configurationList is None:
+                continue
+            for configuration in configurationList[PBXObjectValueKey].get(PBXConfigurationListBuildConfigurationsKey, []):
+                if configuration not in order:
+                    order[configuration] = len(order)
+    return order
+
+def objectName(object):
+    value = object.get(PBXObjectValueKey, {})
+    name = value.get(PBXObjectNameKey) or value.get(PBXObjectPathKey) or ""
+    if name.startswith('"') and name.endswith('"'):
+        name = name[1:-1]
+    return name
+
+def alphabeticalOrderKey(object):
+    name = objectName(object)
+    return name.lower(), name
+
+def foldersFirstOrderKey(object):
+    return object.get(PBXObjectValueKey, {}).get(PBXObjectIsaKey) not in PBXOrderFolderIsas
+
+def trimPBXProjValue(value):
+    return dict((key, value[key]) for key in PBXProjOrderValueKeys if key in value)
+
+def trimPBXProjObject(object):
+    return PBXObjectValue(object[PBXObjectIdKey], object[PBXObjectStartKey], object[PBXObjectEndKey], trimPBXProjValue(object[PBXObjectValueKey]))
+
+def readPBXProjObject(object):
+    return PBXObjectValue(object[PBXObjectIdKey], None, None, trimPBXProjValue(object[PBXObjectValueKey]))
+
+##### PBXProj Sections #####
 
-### Regexes
+### Constants
 
-PBXBuildFileSectionLineRegex = r"(^|\n)(\s*(\w*)\s*(\/\*\s*[^(\*\/)]*\s*\*\/)?\s*=?\s*(\{.*\})?\s*;)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXBuildFile ID
-# 4 = PBXBuildFile name and directory
-# 5 = PBXBuildFile dictionary
+PBXBuildPhaseFilesKey = "files"
 
-PBXBuildFileSectionFileRefRegex = r"fileRef\s*=\s*(\w+)"
-# 1 = PBXBuildFile fileRef
+PBXSectionBlocksKey = "blocks"
+PBXSectionMovesKey = "moves"
+# blocks = PBXObject ID to [length, hash, file IDs] of each organized build phase, only while slices are kept
+# moves = Fewest objects or build phase files that had to move to sort the section
 
 ### Functions
 
-def updatePBXBuildFileSection(text, order):
-    PBXBuildFileSectionRegex = generateSectionRegex("PBXBuildFile")
-    pbxBuildFileSectionBody = re.search(PBXBuildFileSectionRegex, text).group(3)
-    pbxBuildFileSections = re.findall(PBXBuildFileSectionLineRegex, pbxBuildFileSectionBody)
-    elements = {}
-    for section in pbxBuildFileSections:
-        fileRef = re.search(PBXBuildFileSectionFileRefRegex, section[4]).group(1)
-        value = section[1]
-        elements[fileRef] = value
-    sortedArray = sortElements(elements, order)
-    pbxBuildFileSectionBody = "\n".join(sortedArray)
-    updatedText = re.sub(PBXBuildFileSectionRegex, r"\1\2" + pbxBuildFileSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
-
-##### PBXFileReference Section #####
+def sortPBXProjObjects(text, section, order):
+    elements = [(object[PBXObjectIdKey], object) for object in section[PBXSectionObjectsKey]]
+    section[PBXSectionMovesKey] = countMoves(elements, order)
+    section[PBXSectionObjectsKey] = sortElements(elements, order)
+
+def spanPBXProjObject(object):
+    return PBXObjectSpan(object[PBXObjectIdKey], object[PBXObjectStartKey], object[PBXObjectEndKey])
+
+def sortPBXGroups(text, section, order):
+    moves = 0
+    for group in section[PBXSectionObjectsKey]:
+        children = group[PBXObjectValueKey].get(PBXGroupSectionChildrenKey, [])
+        spans = group[PBXObjectItemsKey].get(PBXGroupSectionChildrenKey, [])
+        elements = list(zip(children, spans))
+        if len(spans) > 0:
+            group[PBXObjectItemsKey][PBXGroupSectionChildrenKey] = sortElements(elements, order)
+            moves += countMoves(elements, order)
+    sortPBXProjObjects(text, section, order)
+    section[PBXSectionMovesKey] += moves
+
+def sortPBXBuildPhaseFiles(phase, order):
+    files = phase[PBXObjectValueKey].get(PBXBuildPhaseFilesKey, [])
+    spans = phase[PBXObjectItemsKey].get(PBXBuildPhaseFilesKey, [])
+    elements = list(zip(files, spans))
+    if len(spans) == 0:
+        return 0
+    phase[PBXObjectItemsKey][PBXBuildPhaseFilesKey] = sortElements(elements, order)
+    return countMoves(elements, order)
+
+def sortPBXBuildPhases(text, section, order):
+    blocks = section.get(PBXSectionBlocksKey)
+    moves = 0
+    for phase in section[PBXSectionObjectsKey]:
+        moves += sortPBXBuildPhaseFiles(phase, order)
+        if blocks is None:
+            continue
+        if PBXObjectBlockKey in phase:
+            blocks[phase[PBXObjectIdKey]] = phase[PBXObjectBlockKey]
+            continue
+        block = serializePBXProjObject(text, phase)
+        files = phase[PBXObjectValueKey].get(PBXBuildPhaseFilesKey, [])
+        blocks[phase[PBXObjectIdKey]] = [len(block), hashPBXProj([block]), sortElements([(fileId, fileId) for fileId in files], order)]
+    section[PBXSectionMovesKey] = moves
+
+def updatePBXProjSection(text, section, sort, order):
+    sort(text, section, order)
+    return serializePBXProjSection(text, section)
+
+##### PBXProj #####
 
-### Regexes
+### Constants
 
-PBXFileReferenceSectionLineRegex = r"(^|\n)(\s*(\w*)\s*(\/\*\s*[^(\*\/)]*\s*\*\/)?\s*=?\s*(\{[^\}]*\})?\s*;)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXBuildFile reference ID
-# 4 = PBXBuildFile name
-# 5 = PBXBuildFile dictionary
+PBXProjOptionStageHookKey = "stageHook"
+PBXProjOptionSlicesKey = "slices"
+PBXProjOptionFailFastKey = "failFast"
+PBXProjOptionPruneKey = "prune"
+PBXProjOptionOrderKey = "order"
+# stageHook = Called with a stage dictionary after each organizer stage
+# slices = Hashes of the last organized sections and build phases, updated in place
+# failFast = Stop checking at the first section that is not organized
+# prune = Remove orphaned objects and duplicate build phase files before organizing
+# order = Group order strategy: a PBXOrderStrategies name, "module:function" or a key function (default "tree")
+
+PBXSliceSectionsKey = "sections"
+PBXSliceBlocksKey = "blocks"
+# sections = Section name to hash of the organized section body
+# blocks = Section name to the organized build phase blocks
+
+PBXProjOrders = {
+    "group" : (processPBXProjOrder, ["PBXBuildFile", "PBXGroup", "PBXVariantGroup"]),
+    "target" : (processPBXProjTargetOrder, ["PBXNativeTarget", "PBXProject", "XCConfigurationList"])
+}
+# Order name : (process function, sections it reads)
+# A change to a section an order reads re-sorts every section that uses it, keeping the blocks still in order
+
+PBXSectionRules = [
+    ("PBXBuildFile", sortPBXProjObjects, "group"),
+    ("PBXCopyFilesBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXFileReference", sortPBXProjObjects, "group"),
+    ("PBXFrameworksBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXGroup", sortPBXGroups, "group"),
+    ("PBXHeadersBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXNativeTarget", sortPBXProjObjects, "target"),
+    ("PBXResourcesBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXShellScriptBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXSourcesBuildPhase", sortPBXBuildPhases, "group"),
+    ("PBXVariantGroup", sortPBXGroups, "group"),
+    ("XCBuildConfiguration", sortPBXProjObjects, "target")
+]
+# sortPBXProjObjects = Objects in order
+# sortPBXGroups = Objects and group children in order
+# sortPBXBuildPhases = Build phase files in order, phases in place
+
+PBXSortTrims = {
+    sortPBXProjObjects : spanPBXProjObject
+}
+# Sort function : what is kept of each object parsed only to be sorted
+# sortPBXProjObjects only reads object IDs and spans; the parser's item spans are already in order
+
+PBXOrderStrategyTree = "tree"
+PBXOrderStrategies = {
+    PBXOrderStrategyTree : None,
+    "alphabetical" : alphabeticalOrderKey,
+    "folders-first" : foldersFirstOrderKey
+}
+# Strategy name : key function for the children of each group, None keeps them in place
+# A key function gets the child's object ({} if it is missing); children with equal keys keep their order
+
+PBXOrderStrategySections = ["PBXFileReference", "PBXFileSystemSynchronizedRootGroup", "PBXReferenceProxy", "XCVersionGroup"]
+# Sections a key function reads besides the group order's own, for every kind of group child
 
 ### Functions
 
-def updatePBXFileReferenceSection(text, order):
-    PBXFileReferenceSectionRegex = generateSectionRegex("PBXFileReference")
-    pbxFileReferenceSectionBody = re.search(PBXFileReferenceSectionRegex, text).group(3)
-    pbxFileReferenceSectionLines = re.findall(PBXFileReferenceSectionLineRegex, pbxFileReferenceSectionBody)
-    elements = {}
-    for line in pbxFileReferenceSectionLines:
-        fileRef = line[2]
-        value = line[1]
-        elements[fileRef] = value
-    sortedArray = sortElements(elements, order)
-    pbxFileReferenceSectionBody = "\n".join(sortedArray)
-    updatedText = re.sub(PBXFileReferenceSectionRegex, r"\1\2" + pbxFileReferenceSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
-
-##### PBXFrameworksBuildPhase Section #####
+def resolveOrderStrategy(strategy):
+    if strategy is None or callable(strategy):
+        return strategy
+    if strategy in PBXOrderStrategies:
+        return PBXOrderStrategies[strategy]
+    module, separator, name = strategy.partition(":")
+    if not separator:
+        raise ValueError("Unknown order strategy '%s'" % strategy)
+    import importlib
+    return getattr(importlib.import_module(module), name)
+
+def strategyPBXProjOrders(strategy):
+    key = resolveOrderStrategy(strategy)
+    if key is None:
+        return PBXProjOrders
+    def processPBXProjStrategyOrder(objects, sections):
+        return processPBXProjOrder(objects, sections, key)
+    orderRules = dict(PBXProjOrders)
+    process, orderSections = orderRules["group"]
+    orderRules["group"] = (processPBXProjStrategyOrder, orderSections + PBXOrderStrategySections)
+    return orderRules
+
+def strategyPBXProjTrim(strategy, trim=trimPBXProjObject):
+    # A custom key function may read any key, so it gets full objects in every mode
+    return trim if resolveOrderStrategy(strategy) in PBXOrderStrategies.values() else None
+
+def hashPBXProjSections(text, sections):
+    names = [rule[0] for rule in PBXSectionRules] + PBXOrderStrategySections
+    for process, orderSections in PBXProjOrders.values():
+        names.extend(orderSections)
+    hashes = {}
+    for name in names:
+        if name in sections:
+            hashes[name] = hashPBXProj([sectionBody(text, sections[name])])
+    return hashes
+
+def selectPBXProjUpdates(hashes, slices, orderRules=None):
+    previous = slices.get(PBXSliceSectionsKey, {})
+    changed = set(name for name in hashes if hashes[name] != previous.get(name))
+    names = []
+    blocks = {}
+    for name, sort, orderName in PBXSectionRules:
+        process, orderSections = (orderRules or PBXProjOrders)[orderName]
+        if name not in hashes:
+            continue
+        if name in changed or len(changed.intersection(orderSections)) > 0:
+            names.append(name)
+        if name in slices.get(PBXSliceBlocksKey, {}):
+            blocks[name] = slices[PBXSliceBlocksKey][name]
+    return names, blocks
+
+def rankPBXProjBlocks(blocks, order):
+    unranked = len(order)
+    ranked = {}
+    for objectId, block in (blocks or {}).items():
+        ranks = [order.get(fileId, unranked) for fileId in block[2]]
+        if all(ranks[i] <= ranks[i + 1] for i in range(len(ranks) - 1)):
+            ranked[objectId] = block
+    return ranked
+
+def updatePBXProjSlices(slices, sections, hashes, bodies):
+    blocks = {}
+    for name in hashes:
+        if name in bodies:
+            hashes[name] = hashPBXProj([bodies[name]])
+        if sections[name].get(PBXSectionBlocksKey):
+            blocks[name] = sections[name][PBXSectionBlocksKey]
+        elif name in slices.get(PBXSliceBlocksKey, {}):
+            blocks[name] = slices[PBXSliceBlocksKey][name]
+    slices.clear()
+    slices[PBXSliceSectionsKey] = hashes
+    slices[PBXSliceBlocksKey] = blocks
+
+def preparePBXProjOrder(text, sections, orderName, hook=None, blocks=None, orderRules=None, trim=None):
+    process, orderSections = (orderRules or PBXProjOrders)[orderName]
+    names = [name for name in orderSections if name in sections and PBXSectionObjectsKey not in sections[name]]
+    sorts = dict((name, sort) for name, sort, sortOrderName in PBXSectionRules)
+    start = time.perf_counter()
+    for name in names:
+        sectionTrim = trim if name not in sorts or sorts[name] in PBXSortTrims else None
+        sections[name][PBXSectionObjectsKey] = parsePBXProjSection(text, sections[name], (blocks or {}).get(name), sectionTrim)
+    objects = {}
+    for name in orderSections:
+        for object in sectionObjects(sections, name):
+            objects[object[PBXObjectIdKey]] = object
+    reportStage(hook, "parsePBXProj", start, sum(sections[name][PBXSectionBodyEndKey] - sections[name][PBXSectionBodyStartKey] for name in names), len(objects))
+    start = time.perf_counter()
+    order = process(objects, sections)
+    reportStage(hook, process.__name__, start, 0, len(order))
+    return order
+
+def updatePBXProjSections(text, sections, hook=None, names=None, blocks=None, orders=None, orderRules=None, keepBlocks=False, trim=None):
+    orders = {} if orders is None else orders
+    for name, sort, orderName in PBXSectionRules:
+        if name in sections and (names is None or name in names):
+            section = sections[name]
+            if orderName not in orders:
+                orders[orderName] = preparePBXProjOrder(text, sections, orderName, hook, None, orderRules, trim)
+            order = orders[orderName]
+            if PBXSectionObjectsKey not in section:
+                start = time.perf_counter()
+                section[PBXSectionObjectsKey] = parsePBXProjSection(text, section, rankPBXProjBlocks((blocks or {}).get(name), order), PBXSortTrims.get(sort))
+                reportStage(hook, "parsePBXProjSection", start, section[PBXSectionBodyEndKey] - section[PBXSectionBodyStartKey], len(section[PBXSectionObjectsKey]))
+            if keepBlocks:
+                section[PBXSectionBlocksKey] = {}
+            start = time.perf_counter()
+            body = updatePBXProjSection(text, section, sort, order)
+            reportStage(hook, "update" + name + "Section", start, section[PBXSectionBodyEndKey] - section[PBXSectionBodyStartKey], len(section.pop(PBXSectionObjectsKey)))
+            yield name, body
+
+def preparePBXProj(text, options):
+    hook = options.get(PBXProjOptionStageHookKey)
+    start = time.perf_counter()
+    sections = indexPBXProjSections(text)
+    reportStage(hook, "indexPBXProjSections", start, len(text), len(sections))
+    start = time.perf_counter()
+    hashes = hashPBXProjSections(text, sections)
+    orderRules = strategyPBXProjOrders(options.get(PBXProjOptionOrderKey))
+    names, blocks = selectPBXProjUpdates(hashes, options.get(PBXProjOptionSlicesKey) or {}, orderRules)
+    reportStage(hook, "selectPBXProjUpdates", start, len(text), len(names))
+    return sections, hashes, names, blocks, orderRules, strategyPBXProjTrim(options.get(PBXProjOptionOrderKey))
+
+def organizePBXProj(text, options=None, findings=None):
+    options = options or {}
+    hook = options.get(PBXProjOptionStageHookKey)
+    slices = options.get(PBXProjOptionSlicesKey)
+    sections, hashes, names, blocks, orderRules, trim = preparePBXProj(text, options)
+    if findings is not None or options.get(PBXProjOptionPruneKey):
+        found, spans = auditPBXProjSections(text, sections, hook, options.get(PBXProjOptionPruneKey))
+        if findings is not None:
+            findings.extend(found)
+        if spans and options.get(PBXProjOptionPruneKey):
+            options = dict(options)
+            options[PBXProjOptionPruneKey] = False
+            return organizePBXProj(prunePBXProj(text, spans), options)
+    bodies = dict(updatePBXProjSections(text, sections, hook, names, blocks, None, orderRules, slices is not None, trim))
+    start = time.perf_counter()
+    pieces = assemblePBXProj(text, sections, bodies)
+    if slices is not None:
+        updatePBXProjSlices(slices, sections, hashes, bodies)
+    reportStage(hook, "assemblePBXProj", start, len(text), len(pieces))
+    return pieces
+
+def checkPBXProj(text, options=None, diffs=None, findings=None):
+    options = options or {}
+    hook = options.get(PBXProjOptionStageHookKey)
+    sections, hashes, names, blocks, orderRules, trim = preparePBXProj(text, options)
+    if findings is not None:
+        findings.extend(auditPBXProjSections(text, sections, hook)[0])
+    unorganized = []
+    for name, body in updatePBXProjSections(text, sections, hook, names, blocks, None, orderRules, False, trim):
+        if body != sectionBody(text, sections[name]):
+            unorganized.append(name)
+            if diffs is not None:
+                diffs.append(diffPBXProjSection(text, sections[name], name, body, text.count("\n", 0, sections[name][PBXSectionBodyStartKey]) + 1, hook))
+            if options.get(PBXProjOptionFailFastKey):
+                break
+    return unorganized
+
+def organizeText(text, options=None):
+    return "".join(organizePBXProj(text, options))
+
+##### Diff #####
+
+### Constants
+
+PBXDiffContext = 3
+# Unchanged lines around each change, as in diff -u
+
+PBXDiffSectionKey = "section"
+PBXDiffLineKey = "line"
+PBXDiffMovesKey = "moves"
+PBXDiffHunksKey = "hunks"
+# section = Section name
+# line = Line of the section body in the project.pbxproj
+# moves = Fewest objects or build phase files that have to move to organize the section
+# hunks = Unified diff hunks of the reordered lines
 
 ### Functions
 
+def matchPBXProjLines(oldLines, newLines):
+    positions = {}
+    for index in range(len(oldLines) - 1, -1, -1):
+        positions.setdefault(oldLines[index], []).append(index)
+    matches = []
+    for index, line in enumerate(newLines):
+        candidates = positions.get(line)
+        if candidates:
+            matches.append((candidates.pop(), index))
+    tails = []
+    tailMatches = []
+    previous = []
+    for index, match in enumerate(matches):
+        slot = bisect.bisect_left(tails, match[0])
+        if slot == len(tails):
+            tails.append(match[0])
+            tailMatches.append(index)
+        else:
+            tails[slot] = match[0]
+            tailMatches[slot] = index
+        previous.append(tailMatches[slot - 1] if slot > 0 else -1)
+    kept = []
+    index = tailMatches[-1] if tailMatches else -1
+    while index != -1:
+        kept.append(matches[index])
+        index = previous[index]
+    kept.reverse()
+    return kept
+
+def diffPBXProjLines(oldLines, newLines):
+    operations = []
+    oldIndex = newIndex = 0
+    for oldKept, newKept in matchPBXProjLines(oldLines, newLines) + [(len(oldLines), len(newLines))]:
+        operations.extend(("-", line) for line in oldLines[oldIndex:oldKept])
+        operations.extend(("+", line) for line in newLines[newIndex:newKept])
+        if oldKept < len(oldLines):
+            operations.append((" ", oldLines[oldKept]))
+        oldIndex, newIndex = oldKept + 1, newKept + 1
+    return operations
+
+def formatPBXProjHunks(operations, line, title):
+    changes = [index for index, operation in enumerate(operations) if operation[0] != " "]
+    spans = []
+    for index in changes:
+        start, end = max(index - PBXDiffContext, 0), min(index + PBXDiffContext + 1, len(operations))
+        if spans and start <= spans[-1][1]:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+    hunks = []
+    oldLine = newLine = line
+    position = 0
+    for start, end in spans:
+        for kind, text in operations[position:start]:
+            oldLine += kind != "+"
+            newLine += kind != "-"
+        lines = [kind + text + "\n" for kind, text in operations[start:end]]
+        oldCount = len([text for text in lines if text[0] != "+"])
+        newCount = len([text for text in lines if text[0] != "-"])
+        hunks.append("@@ -%d,%d +%d,%d @@ %s\n" % (oldLine if oldCount else oldLine - 1, oldCount, newLine if newCount else newLine - 1, newCount, title) + "".join(lines))
+        for kind, text in operations[start:end]:
+            oldLine += kind != "+"
+            newLine += kind != "-"
+        position = end
+    return hunks
+
+def diffPBXProjSection(text, section, name, body, line, hook=None):
+    start = time.perf_counter()
+    oldLines = sectionBody(text, section).split("\n")
+    newLines = body.split("\n")
+    prefix = 0
+    while prefix < min(len(oldLines), len(newLines)) and oldLines[prefix] == newLines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(oldLines), len(newLines)) - prefix and oldLines[-1 - suffix] == newLines[-1 - suffix]:
+        suffix += 1
+    head = max(prefix - PBXDiffContext, 0)
+    tail = min(suffix, PBXDiffContext)
+    operations = [(" ", content) for content in oldLines[head:prefix]]
+    operations.extend(diffPBXProjLines(oldLines[prefix:len(oldLines) - suffix], newLines[prefix:len(newLines) - suffix]))
+    operations.extend((" ", content) for content in oldLines[len(oldLines) - suffix:len(oldLines) - suffix + tail])
+    hunks = formatPBXProjHunks(operations, line + head, name + " section")
+    reportStage(hook, "diffPBXProjSection", start, len(body), len(hunks))
+    return {
+        PBXDiffSectionKey : name,
+        PBXDiffLineKey : line,
+        PBXDiffMovesKey : section.get(PBXSectionMovesKey, 0),
+        PBXDiffHunksKey : hunks
+    }
+
+def formatPBXProjDiff(filename, diffs):
+    pieces = ["--- a/" + filename + "\n", "+++ b/" + filename + "\n"]
+    for diff in sorted(diffs, key=lambda x: x[PBXDiffLineKey]):
+        pieces.extend(diff[PBXDiffHunksKey])
+    return "".join(pieces)
+
+##### Audit #####
+
+### Constants
+
+PBXBuildFileSectionProductRefKey = "productRef"
+
+PBXAuditOrphanSectionNames = ["PBXBuildFile", "PBXFileReference"]
+PBXAuditBuildPhaseSectionNames = [name for name, sort, orderName in PBXSectionRules if sort == sortPBXBuildPhases]
+# PBXAuditOrphanSectionNames = Sections whose objects are orphaned once nothing refers to them
+
+PBXFindingOrphaned = "orphaned"
+PBXFindingDuplicate = "duplicate"
+# orphaned = Object that no other object refers to
+# duplicate = Build phase file whose build file, file or product is already in the phase
+
+PBXFindingKindKey = "kind"
+PBXFindingSectionKey = "section"
+PBXFindingIdKey = "id"
+PBXFindingNameKey = "name"
+PBXFindingPhaseKey = "phase"
+# section = Section of the orphaned object or of the build phase
+# id = PBXObject ID of the orphaned object or of the duplicate build file
+# name = Comment next to the ID, if any
+# phase = PBXObject ID of the build phase with the duplicate
+
 ### Regexes
 
-PBXFrameworksBuildPhaseSectionsRegex = r"([ \t]*(\w+)?[ \t]*(\/\*\s*([\w \t]*)[ \t]*\*\/)?\s*=\s*\{\s*\n([^\}]*files\s*=\s*\(\s([^\)]*,)?\s*\)\s*;[^\}]*)\}\s*;[^\n]*)"
-# 1 = (value)
-# 2 = PBXFrameworksBuildPhase section ID
-# 3 = (unused)
-# 4 = PBXFrameworksBuildPhase section title
-# 5 = (unused)
-# 6 = PBXFrameworksBuildPhase files
-
-PBXFrameworksBuildPhaseFileRegex = r"(^|\n)(\s*(\w*)\s*(\/\*[^,]*\*\/),)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXFrameworksBuildPhase file ID
-# 4 = PBXFrameworksBuildPhase file name and directory
-
-PBXFrameworksBuildPhaseFilesRegex = r"([\S\s]*files\s*=\s*\([ \t]*\n)([\S\s]*,[ \t]*)\s*\n([ \t]*\)\s*;[\S\s]*)"
-# 1 = (start of file)
-# 2 = PBXFrameworksBuildPhase files section
-# 3 = (end of file)
-
-def updatePBXFrameworksBuildPhaseSection(text, order):
-    PBXFrameworksBuildPhaseSectionRegex = generateSectionRegex("PBXFrameworksBuildPhase")
-    pbxFrameworksBuildPhaseSectionBody = re.search(PBXFrameworksBuildPhaseSectionRegex, text).group(3)
-    pbxFrameworksBuildPhaseSections = re.findall(PBXFrameworksBuildPhaseSectionsRegex, pbxFrameworksBuildPhaseSectionBody)
-    for section in pbxFrameworksBuildPhaseSections:
-        value = section[0]
-        pbxFrameworksBuildPhaseSectionFiles = re.findall(PBXFrameworksBuildPhaseFileRegex, section[5])
-        elements = {}
-        for file in pbxFrameworksBuildPhaseSectionFiles:
-            fileRef = file[2]
-            fileValue = file[1]
-            elements[fileRef] = fileValue
-        sortedArray = sortElements(elements, order)
-        filesString = "\n".join(sortedArray)
-        updatedSection = re.sub(PBXFrameworksBuildPhaseFilesRegex, r"\1" + filesString + r"\3", value, flags=re.IGNORECASE)
-        pbxFrameworksBuildPhaseSectionBody = re.sub(value, updatedSection, pbxFrameworksBuildPhaseSectionBody, flags=re.IGNORECASE)
-    updatedText = re.sub(PBXFrameworksBuildPhaseSectionRegex, r"\1\2" + pbxFrameworksBuildPhaseSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
-
-##### PBXGroup Section #####
+PBXCommentRegex = re.compile(r"[ \t]*\/\*\s*(.*?)\s*\*\/")
+# 1 = Comment text
 
 ### Functions
 
-def updatePBXGroupSection(text, order):
-    PBXGroupSectionRegex = generateSectionRegex("PBXGroup")
-    pbxGroupSectionBody = re.search(PBXGroupSectionRegex, text).group(3)
-    pbxGroupSections = re.findall(PBXGroupSectionGroupRegex, pbxGroupSectionBody)
-    elements = {}
-    for section in pbxGroupSections:
-        fileRef = section[2]
-        value = section[1]
-        elements[fileRef] = value
-    sortedArray = sortElements(elements, order)
-    pbxGroupSectionBody = "\n".join(sortedArray)
-    updatedText = re.sub(PBXGroupSectionRegex, r"\1\2" + pbxGroupSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
-
-##### PBXResourcesBuildPhase Section #####
+def indexPBXProjReferences(sections):
+    objects = {}
+    for name, section in sections.items():
+        for object in section.get(PBXSectionObjectsKey, []):
+            objects[object[PBXObjectIdKey]] = (name, object)
+    references = {}
+    counts = dict.fromkeys(objects, 0)
+    for objectId, (name, object) in objects.items():
+        found = []
+        stack = [object[PBXObjectValueKey]]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif value in objects and value != objectId:
+                found.append(value)
+                counts[value] += 1
+        references[objectId] = found
+    return objects, references, counts
+
+def findPBXProjComment(text, position):
+    match = PBXCommentRegex.match(text, position)
+    return match.group(1) if match else None
+
+def auditPBXProj(text, sections, prune=False):
+    objects, references, counts = indexPBXProjReferences(sections)
+    findings = []
+    for name in PBXAuditBuildPhaseSectionNames:
+        for phase in sectionObjects(sections, name):
+            seen = set()
+            files = phase[PBXObjectValueKey].get(PBXBuildPhaseFilesKey, [])
+            for fileId, span in zip(files, phase[PBXObjectItemsKey].get(PBXBuildPhaseFilesKey, [])):
+                keys = [fileId]
+                if fileId in objects:
+                    value = objects[fileId][1][PBXObjectValueKey]
+                    keys.extend(value[key] for key in [PBXBuildFileSectionFileRefKey, PBXBuildFileSectionProductRefKey] if key in value)
+                if seen.isdisjoint(keys):
+                    seen.update(keys)
+                    continue
+                # A duplicate only stops referring to its build file once it is pruned
+                if prune and fileId in counts:
+                    counts[fileId] -= 1
+                findings.append(({
+                    PBXFindingKindKey : PBXFindingDuplicate,
+                    PBXFindingSectionKey : name,
+                    PBXFindingIdKey : fileId,
+                    PBXFindingNameKey : findPBXProjComment(text, span[0] + len(fileId)),
+                    PBXFindingPhaseKey : phase[PBXObjectIdKey]
+                }, span))
+    orphans = [objectId for objectId, count in counts.items() if count == 0 and objects[objectId][0] in PBXAuditOrphanSectionNames]
+    removed = set()
+    while orphans:
+        objectId = orphans.pop()
+        if objectId in removed:
+            continue
+        removed.add(objectId)
+        name, object = objects[objectId]
+        findings.append(({
+            PBXFindingKindKey : PBXFindingOrphaned,
+            PBXFindingSectionKey : name,
+            PBXFindingIdKey : objectId,
+            PBXFindingNameKey : findPBXProjComment(text, object[PBXObjectStartKey] + len(objectId))
+        }, (object[PBXObjectStartKey], object[PBXObjectEndKey])))
+        for reference in references[objectId]:
+            counts[reference] -= 1
+            if counts[reference] == 0 and objects[reference][0] in PBXAuditOrphanSectionNames:
+                orphans.append(reference)
+    findings.sort(key=lambda x: x[1])
+    return [finding for finding, span in findings], [span for finding, span in findings]
+
+def auditPBXProjSections(text, sections, hook=None, prune=False):
+    names = [name for name in sections if PBXSectionObjectsKey not in sections[name]]
+    start = time.perf_counter()
+    parsePBXProj(text, sections, names)
+    findings, spans = auditPBXProj(text, sections, prune)
+    reportStage(hook, "auditPBXProj", start, sum(sections[name][PBXSectionBodyEndKey] - sections[name][PBXSectionBodyStartKey] for name in names), len(findings))
+    return findings, spans
+
+def prunePBXProj(text, spans):
+    pieces = []
+    position = 0
+    for start, end in sorted(spans):
+        lineStart = text.rfind("\n", 0, start) + 1
+        lineEnd = text.find("\n", end)
+        lineEnd = len(text) if lineEnd == -1 else lineEnd + 1
+        if not text[lineStart:start].strip() and not text[end:lineEnd].strip():
+            start, end = lineStart, lineEnd
+        else:
+            while end < len(text) and text[end] in " \t":
+                end += 1
+        if start < position:
+            continue
+        pieces.append(text[position:start])
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+def formatFinding(finding):
+    line = finding[PBXFindingKindKey] + " " + finding[PBXFindingSectionKey] + " " + finding[PBXFindingIdKey]
+    if finding[PBXFindingNameKey]:
+        line += " (" + finding[PBXFindingNameKey] + ")"
+    if PBXFindingPhaseKey in finding:
+        line += " in " + finding[PBXFindingPhaseKey]
+    return line
+
+##### Streaming #####
 
-### Regexes
+### Constants
 
-PBXResourcesBuildPhaseSectionsRegex = r"(([ \t]*(\w*)[ \t]*(\/\*.*\*\/)[ \t]*=[ \t]*\{[^\}]*files[ \t]*=[ \t]*\(\n?)([^\)]*,[ \t]*)?\s*\n([^\}]*\}[ \t]*;))"
-# 1 = (value)
-# 2 = (start of file)
-# 3 = PBXResourcesBuildPhase section ID
-# 4 = PBXResourcesBuildPhase section name
-# 5 = PBXResourcesBuildPhase section files
-# 6 = (end of file)
+PBXStreamHashKey = "hash"
+PBXStreamHashesKey = "hashes"
+PBXStreamNamesKey = "names"
+PBXStreamBlocksKey = "blocks"
+PBXStreamOrdersKey = "orders"
+# hash = PBXProj hash of the whole file
+# hashes = Section name to hash of the section body
+# names = Sections to organize
+# blocks = Organized build phase blocks to reuse, by section name
+# orders = Order name to rank map
 
-PBXResourcesBuildPhaseFileRegex = r"(^|\n)(\s*(\w*)\s*(\/\*[^,]*\*\/),)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXFrameworksBuildPhase fileRef
-# 4 = PBXFrameworksBuildPhase file name and directory
+### Functions
+
+def readPBXProjLines(filename):
+    with open(filename, "r", encoding=PBXProjEncoding, errors=PBXProjEncodingErrors, newline="") as file:
+        for line in file:
+            yield line
+
+def splitPBXProjStream(lines):
+    chunks = []
+    pieces = []
+    name = None
+    for line in lines:
+        if len(pieces) >= PBXProjJoinChunk:
+            chunks.append("".join(pieces))
+            pieces = []
+        while line:
+            if name is None:
+                start = line.find(PBXSectionBeginMarker)
+                nameEnd = line.find(PBXSectionMarkerSuffix, start + len(PBXSectionBeginMarker)) if start != -1 else -1
+                if nameEnd == -1:
+                    pieces.append(line)
+                    break
+                chunks.append("".join(pieces) + line[:start])
+                text = "".join(chunks)
+                chunks = []
+                pieces = []
+                yield None, text
+                name = line[start + len(PBXSectionBeginMarker):nameEnd]
+                line = line[start:]
+            endMarker = PBXSectionEndMarker + name + PBXSectionMarkerSuffix
+            end = line.find(endMarker)
+            if end == -1:
+                pieces.append(line)
+                break
+            chunks.append("".join(pieces) + line[:end + len(endMarker)])
+            text = "".join(chunks)
+            chunks = []
+            pieces = []
+            yield name, text
+            name = None
+            line = line[end + len(endMarker):]
+    chunks.append("".join(pieces))
+    yield None, "".join(chunks)
+
+def preparePBXProjStream(filename, options):
+    hook = options.get(PBXProjOptionStageHookKey)
+    start = time.perf_counter()
+    digest = hashlib.sha1()
+    size = 0
+    hashes = {}
+    for name, text in splitPBXProjStream(readPBXProjLines(filename)):
+        for data in encodePBXProj([text]):
+            digest.update(data)
+        size += len(text)
+        section = indexPBXProjSections(text).get(name)
+        if section is not None:
+            hashes.update(hashPBXProjSections(text, {name : section}))
+    orderRules = strategyPBXProjOrders(options.get(PBXProjOptionOrderKey))
+    names, blocks = selectPBXProjUpdates(hashes, options.get(PBXProjOptionSlicesKey) or {}, orderRules)
+    reportStage(hook, "selectPBXProjUpdates", start, size, len(names))
+    trim = strategyPBXProjTrim(options.get(PBXProjOptionOrderKey), readPBXProjObject)
+    orderNames = []
+    orderSections = set()
+    for name, sort, orderName in PBXSectionRules:
+        if name in names and orderName not in orderNames:
+            orderNames.append(orderName)
+            orderSections.update(orderRules[orderName][1])
+    sections = {}
+    if len(orderSections) > 0:
+        start = time.perf_counter()
+        size = 0
+        for name, text in splitPBXProjStream(readPBXProjLines(filename)):
+            section = indexPBXProjSections(text).get(name) if name in orderSections else None
+            if section is not None:
+                sections[name] = {
+                    PBXSectionObjectsKey : parsePBXProjSection(text, section, trim=trim)
+                }
+                size += section[PBXSectionBodyEndKey] - section[PBXSectionBodyStartKey]
+        reportStage(hook, "parsePBXProjStream", start, size, sum(len(section[PBXSectionObjectsKey]) for section in sections.values()))
+    orders = {}
+    for orderName in orderNames:
+        orders[orderName] = preparePBXProjOrder(None, sections, orderName, hook, None, orderRules)
+    return {
+        PBXStreamHashKey : digest.hexdigest(),
+        PBXStreamHashesKey : hashes,
+        PBXStreamNamesKey : names,
+        PBXStreamBlocksKey : blocks,
+        PBXStreamOrdersKey : orders
+    }
+
+def updatePBXProjStream(filename, stream, options):
+    hook = options.get(PBXProjOptionStageHookKey)
+    names = stream[PBXStreamNamesKey]
+    trims = dict((name, PBXSortTrims.get(sort)) for name, sort, orderName in PBXSectionRules)
+    orderNames = dict((name, orderName) for name, sort, orderName in PBXSectionRules)
+    keepBlocks = options.get(PBXProjOptionSlicesKey) is not None
+    for name, text in splitPBXProjStream(readPBXProjLines(filename)):
+        sections = indexPBXProjSections(text) if name in names else {}
+        if name not in sections:
+            yield text, {}, {}
+            continue
+        section = sections[name]
+        start = time.perf_counter()
+        blocks = rankPBXProjBlocks(stream[PBXStreamBlocksKey].get(name), stream[PBXStreamOrdersKey][orderNames[name]])
+        section[PBXSectionObjectsKey] = parsePBXProjSection(text, section, blocks, trims.get(name))
+        reportStage(hook, "parsePBXProjSection", start, section[PBXSectionBodyEndKey] - section[PBXSectionBodyStartKey], len(section[PBXSectionObjectsKey]))
+        bodies = dict(updatePBXProjSections(text, sections, hook, [name], None, stream[PBXStreamOrdersKey], None, keepBlocks))
+        yield text, sections, bodies
+
+def organizePBXProjStream(filename, stream, options=None):
+    options = options or {}
+    slices = options.get(PBXProjOptionSlicesKey)
+    hashes = stream[PBXStreamHashesKey]
+    organized = {}
+    for text, sections, bodies in updatePBXProjStream(filename, stream, options):
+        for name, body in bodies.items():
+            hashes[name] = hashPBXProj([body])
+            organized[name] = sections[name]
+        for piece in assemblePBXProj(text, sections, bodies):
+            yield piece
+    if slices is not None:
+        updatePBXProjSlices(slices, dict((name, organized.get(name, {})) for name in hashes), hashes, {})
+
+def checkPBXProjStream(filename, stream, options=None, diffs=None):
+    options = options or {}
+    hook = options.get(PBXProjOptionStageHookKey)
+    unorganized = []
+    lines = 0
+    for text, sections, bodies in updatePBXProjStream(filename, stream, options):
+        for name, body in bodies.items():
+            if body != sectionBody(text, sections[name]):
+                unorganized.append(name)
+                if diffs is not None:
+                    diffs.append(diffPBXProjSection(text, sections[name], name, body, lines + text.count("\n", 0, sections[name][PBXSectionBodyStartKey]) + 1, hook))
+        lines += text.count("\n")
+        if unorganized and options.get(PBXProjOptionFailFastKey):
+            break
+    return unorganized
+
+##### Cache #####
+
+### Constants
+
+PBXProjCacheFilename = "pbxproj_organizer.json"
+PBXProjCacheRacyInterval = 2 # seconds
+
+PBXProjCacheKeyKey = "key"
+PBXProjCacheSizeKey = "size"
+PBXProjCacheMTimeKey = "mtime"
+PBXProjCacheHashKey = "hash"
+PBXProjCacheWrittenKey = "written"
+PBXProjCacheSlicesKey = "slices"
+# key = Organizer version, script and configuration
+# size = Size of the organized project.pbxproj
+# mtime = Modification time (ns) of the organized project.pbxproj
+# hash = PBXProj hash of the organized project.pbxproj
+# written = Time (ns) the cache was written
+# slices = Section and build phase hashes of the organized project.pbxproj
 
 ### Functions
 
-def updatePBXResourcesBuildPhaseSection(text, order):
-    PBXResourcesBuildPhaseSectionRegex = generateSectionRegex("PBXResourcesBuildPhase")
-    pbxResourcesBuildPhaseSectionBody = re.search(PBXResourcesBuildPhaseSectionRegex, text).group(3)
-    pbxResourcesBuildPhaseSections = re.findall(PBXResourcesBuildPhaseSectionsRegex, pbxResourcesBuildPhaseSectionBody)
-    for section in pbxResourcesBuildPhaseSections:
-        value = section[0]
-        pbxResourcesBuildPhaseSectionFiles = re.findall(PBXResourcesBuildPhaseFileRegex, section[4])
-        elements = {}
-        for file in pbxResourcesBuildPhaseSectionFiles:
-            fileRef = file[2]
-            fileValue = file[1]
-            elements[fileRef] = fileValue
-        sortedArray = sortElements(elements, order)
-        filesString = "\n".join(sortedArray)
-        updatedSection = re.sub(PBXResourcesBuildPhaseSectionsRegex, r"\2" + filesString + r"\6", value, flags=re.IGNORECASE);
-        pbxResourcesBuildPhaseSectionBody = re.sub(value, updatedSection, pbxResourcesBuildPhaseSectionBody, flags=re.IGNORECASE)
-    updatedText = re.sub(PBXResourcesBuildPhaseSectionRegex, r"\1\2" + pbxResourcesBuildPhaseSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
-
-##### PBXSourcesBuildPhase Section #####
+def generateCacheConfiguration(options):
+    configuration = {}
+    if options.get(PBXProjOptionPruneKey):
+        configuration[PBXProjOptionPruneKey] = True
+    strategy = options.get(PBXProjOptionOrderKey) or PBXOrderStrategyTree
+    if callable(strategy):
+        strategy = strategy.__module__ + ":" + strategy.__qualname__
+    if strategy != PBXOrderStrategyTree:
+        configuration[PBXProjOptionOrderKey] = strategy
+    return configuration
+
+def generateCacheKey(configuration):
+    script = os.stat(os.path.abspath(__file__))
+    key = [PBXProjOrganizerVersion, script.st_size, script.st_mtime_ns, configuration]
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def generateCachePath(project, cacheDirectory=None):
+    if cacheDirectory is not None:
+        name = hashlib.sha1(os.path.abspath(project).encode("utf-8")).hexdigest() + ".json"
+        return os.path.join(cacheDirectory, name)
+    user = os.environ.get("USER") or os.environ.get("LOGNAME") or "default"
+    return os.path.join(project, "xcuserdata", user + ".xcuserdatad", PBXProjCacheFilename)
+
+def readCache(path):
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except (IOError, OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def writeCache(path, key, status, pbxProjHash, slices=None):
+    cache = {
+        PBXProjCacheKeyKey : key,
+        PBXProjCacheSizeKey : status.st_size,
+        PBXProjCacheMTimeKey : status.st_mtime_ns,
+        PBXProjCacheHashKey : pbxProjHash,
+        PBXProjCacheWrittenKey : time.time_ns(),
+        PBXProjCacheSlicesKey : slices or {}
+    }
+    import tempfile
+    try:
+        directory, name = os.path.split(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        descriptor, temporaryPath = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=directory or os.curdir)
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(cache, file)
+            os.replace(temporaryPath, path)
+        except BaseException:
+            try:
+                os.unlink(temporaryPath)
+            except OSError:
+                pass
+            raise
+    except (IOError, OSError):
+        pass
 
-### Regexes
+def isCacheFresh(cache, key, status):
+    if cache.get(PBXProjCacheKeyKey) != key:
+        return False
+    if cache.get(PBXProjCacheSizeKey) != status.st_size or cache.get(PBXProjCacheMTimeKey) != status.st_mtime_ns:
+        return False
+    return cache.get(PBXProjCacheWrittenKey, 0) - status.st_mtime_ns > PBXProjCacheRacyInterval * 1000000000
 
-PBXSourcesBuildPhaseSectionsRegex = r"(([ \t]*(\w*)[ \t]*(\/\*.*\*\/)[ \t]*=[ \t]*\{[ \t]*[^\}]*files[ \t]*=[ \t]*\([ \t]*)\n?([^\)]*,[ \t]*)?\s*\n([ \t]*\)[ \t]*;[^\}]*\}[ \t]*;))"
-# 1 = (value)
-# 2 = (start of file)
-# 3 = PBXSourcesBuildPhase section ID
-# 4 = PBXSourcesBuildPhase section name
-# 5 = PBXSourcesBuildPhase section files
-# 6 = (end of file)
+def isCacheMatch(cache, key, pbxProjHash):
+    return cache.get(PBXProjCacheKeyKey) == key and cache.get(PBXProjCacheHashKey) == pbxProjHash
 
-PBXSourcesBuildPhaseFileRegex = r"(^|\n)(\s*(\w*)\s*(\/\*[^,]*\*\/),)"
-# 1 = (start of file / newline)
-# 2 = (value)
-# 3 = PBXSourcesBuildPhase file ID
-# 4 = PBXSourcesBuildPhase file name and directory
+def readCacheSlices(cache, key):
+    slices = cache.get(PBXProjCacheSlicesKey)
+    if cache.get(PBXProjCacheKeyKey) != key or not isinstance(slices, dict):
+        return {}
+    return slices
+
+##### Discovery #####
+
+### Constants
+
+PBXProjExtension = ".xcodeproj"
+XCWorkspaceExtension = ".xcworkspace"
+XCWorkspaceContentsFilename = "contents.xcworkspacedata"
+
+PBXProjDiscoveryPrunedDirectories = set([".git", ".svn", ".hg", "build", "DerivedData", "Pods", "Carthage", "node_modules"])
 
 ### Functions
 
-def updatePBXSourcesBuildPhaseSection(text, order):
-    PBXSourcesBuildPhaseSectionRegex = generateSectionRegex("PBXSourcesBuildPhase")
-    pbxSourcesBuildPhaseSectionBody = re.search(PBXSourcesBuildPhaseSectionRegex, text).group(3)
-    pbxSourcesBuildPhaseSections = re.findall(PBXSourcesBuildPhaseSectionsRegex, pbxSourcesBuildPhaseSectionBody)
-    for section in pbxSourcesBuildPhaseSections:
-        value = section[0]
-        pbxSourcesBuildPhaseFiles = re.findall(PBXSourcesBuildPhaseFileRegex, section[4])
-        elements = {}
-        for file in pbxSourcesBuildPhaseFiles:
-            fileRef = file[2]
-            fileValue = file[1]
-            elements[fileRef] = fileValue
-        sortedArray = sortElements(elements, order)
-        filesString = "\n".join(sortedArray)
-        updatedSection = re.sub(PBXSourcesBuildPhaseSectionsRegex, r"\2" + filesString + r"\6", value, flags=re.IGNORECASE)
-        pbxSourcesBuildPhaseSectionBody = re.sub(value, updatedSection, pbxSourcesBuildPhaseSectionBody, flags=re.IGNORECASE)
-    updatedText = re.sub(PBXSourcesBuildPhaseSectionRegex, r"\1\2" + pbxSourcesBuildPhaseSectionBody + r"\4\5", text, flags=re.IGNORECASE)
-    return updatedText
+def translateExcludePattern(pattern):
+    anchored = "/" in pattern
+    parts = pattern.lstrip("/").split("/")
+    regex = "" if anchored else "(?:.*/)?"
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            regex += ".*" if last else "(?:.*/)?"
+            continue
+        j = 0
+        while j < len(part):
+            character = part[j]
+            j += 1
+            if character == "*":
+                regex += "[^/]*"
+            elif character == "?":
+                regex += "[^/]"
+            elif character == "\\" and j < len(part):
+                regex += re.escape(part[j])
+                j += 1
+            elif character == "[" and part.find("]", j + (part[j:j + 1] in ["!", "^"]) + 1) != -1:
+                negated = part[j:j + 1] in ["!", "^"]
+                end = part.find("]", j + negated + 1)
+                content = "".join("\\" + x if x in "\\[]^" else x for x in part[j + negated:end])
+                regex += "(?!/)[" + ("^" if negated else "") + content + "]"
+                j = end + 1
+            else:
+                regex += re.escape(character)
+        if not last:
+            regex += "/"
+    return regex + r"\Z"
+
+def compileExcludePatterns(patterns):
+    excludes = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        excluded = not pattern.startswith("!")
+        if not excluded or pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            continue
+        regex = translateExcludePattern(pattern)
+        if excludes and excludes[-1][1] == excluded:
+            excludes[-1][0].append(regex)
+        else:
+            excludes.append(([regex], excluded))
+    return [(re.compile("|".join(regexes)), excluded) for regexes, excluded in excludes]
+
+def readExcludePatterns(filename):
+    with open(filename) as file:
+        return file.read().splitlines()
+
+def isExcluded(path, excludes):
+    for regex, excluded in reversed(excludes):
+        if regex.match(path):
+            return excluded
+    return False
+
+def readWorkspaceProjects(workspace):
+    import xml.etree.ElementTree
+    try:
+        root = xml.etree.ElementTree.parse(os.path.join(workspace, XCWorkspaceContentsFilename)).getroot()
+    except (IOError, OSError, xml.etree.ElementTree.ParseError):
+        return []
+    container = os.path.dirname(workspace)
+    projects = []
+    stack = [(root, container)]
+    while len(stack) > 0:
+        element, directory = stack.pop()
+        for child in reversed(list(element)):
+            kind, _, location = child.get("location", "").partition(":")
+            if kind == "group":
+                path = os.path.join(directory, location)
+            elif kind == "container":
+                path = os.path.join(container, location)
+            elif kind == "absolute":
+                path = location
+            else:
+                path = directory
+            if child.tag == "Group":
+                stack.append((child, path))
+            elif child.tag == "FileRef" and path.endswith(PBXProjExtension):
+                projects.append(os.path.normpath(path))
+    projects.reverse()
+    return projects
+
+def readRoots(paths, stdin=None):
+    for path in paths:
+        if path != "-":
+            yield path
+            continue
+        for line in stdin or sys.stdin:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+def discoverProjects(roots, excludes=(), recursive=True):
+    seen = set([])
+    for root in roots:
+        if not os.path.isdir(root) or not os.access(root, os.R_OK | os.X_OK):
+            # An unreadable root is passed on so that it fails like a project instead of stopping the run
+            yield os.path.normpath(root)
+            continue
+        explicit = root.endswith(PBXProjExtension)
+        if explicit:
+            candidates = [root]
+        elif not recursive:
+            candidates = sorted(os.path.join(root, name) for name in os.listdir(root) if name.endswith(PBXProjExtension))
+        else:
+            candidates = walkProjects(root, excludes)
+        for project in candidates:
+            key = os.path.realpath(project)
+            # A project named explicitly is passed on even without a project.pbxproj so that it fails
+            if key not in seen and (explicit or os.path.isfile(os.path.join(project, PBXProjFilename))):
+                seen.add(key)
+                yield os.path.normpath(project)
+
+def isExcludedPath(path, root, excludes=()):
+    parts = os.path.relpath(path, root).split(os.sep)
+    for i, part in enumerate(parts):
+        if part == os.pardir:
+            continue
+        if part in PBXProjDiscoveryPrunedDirectories or isExcluded("/".join(parts[:i + 1]), excludes):
+            return True
+    return False
+
+def walkProjects(root, excludes=()):
+    stack = [(root, "")]
+    while len(stack) > 0:
+        directory, relative = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda x: x.name)
+        except OSError:
+            continue
+        directories = []
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False) or entry.name in PBXProjDiscoveryPrunedDirectories:
+                continue
+            path = relative + "/" + entry.name if relative else entry.name
+            if isExcluded(path, excludes):
+                continue
+            if entry.name.endswith(PBXProjExtension):
+                yield entry.path
+            elif entry.name.endswith(XCWorkspaceExtension):
+                for project in readWorkspaceProjects(entry.path):
+                    if not isExcludedPath(project, root, excludes):
+                        yield project
+            else:
+                directories.append((entry.path, path))
+        stack.extend(reversed(directories))
+
+##### Projects #####
 
-########## SCRIPT ##########
+### Constants
 
-##### Imports
+PBXProjFilename = "project.pbxproj"
+
+PBXProjOptionCacheKey = "cache"
+PBXProjOptionCacheDirectoryKey = "cacheDirectory"
+PBXProjOptionProfileKey = "profile"
+PBXProjOptionCheckKey = "check"
+PBXProjOptionStreamKey = "stream"
+PBXProjOptionDiffKey = "diff"
+PBXProjOptionAuditKey = "audit"
+# cache = Read and write the organizer cache (default True)
+# cacheDirectory = Directory for cache files (default each project's xcuserdata)
+# profile = Collect stage timings in the result (default False)
+# check = Report unorganized sections instead of writing (default False)
+# stream = Read the project.pbxproj one section at a time instead of all at once (default False)
+# diff = With check, collect a unified diff and move count for each unorganized section (default False)
+# audit = Report orphaned objects and duplicate build phase files, bypassing the cache (default False)
+
+PBXProjResultProjectKey = "project"
+PBXProjResultStatusKey = "status"
+PBXProjResultErrorKey = "error"
+PBXProjResultStagesKey = "stages"
+PBXProjResultSectionsKey = "sections"
+PBXProjResultElapsedKey = "elapsed"
+PBXProjResultBytesKey = "bytes"
+PBXProjResultDiffsKey = "diffs"
+PBXProjResultFindingsKey = "findings"
+# elapsed = Wall time spent on the project in seconds
+# bytes = Size of the project.pbxproj afterwards
+# diffs = Diff of each unorganized section, see PBXDiffSectionKey
+# findings = Orphaned objects and duplicate build phase files found, or pruned with prune, see PBXFindingKindKey
+
+PBXProjSummaryKey = "summary"
+PBXProjSummaryProjectsKey = "projects"
+PBXProjSummaryMovesKey = "moves"
+PBXProjSummaryFindingsKey = "findings"
+# summary = Totals over all results: projects, projects per status, bytes and elapsed
+# moves = Section name to moves over all diffs
+# findings = Finding kind to count over all results
+
+PBXProjStatusOrganized = "organized"
+PBXProjStatusUnchanged = "unchanged"
+PBXProjStatusUnorganized = "unorganized"
+PBXProjStatusFailed = "failed"
 
-import glob
+### Functions
 
-##### Code
+def readPBXProjFile(filename):
+    with open(filename, "rb") as file:
+        return file.read().decode(PBXProjEncoding, PBXProjEncodingErrors)
+
+def writePBXProjFile(filename, pieces, unchangedHash=None):
+    import tempfile
+    filename = os.path.realpath(filename)
+    directory, name = os.path.split(filename)
+    mode = stat.S_IMODE(os.stat(filename).st_mode)
+    descriptor, temporaryPath = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=directory)
+    digest = hashlib.sha1()
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            for data in encodePBXProj(pieces):
+                digest.update(data)
+                file.write(data)
+            file.flush()
+            pbxProjHash = digest.hexdigest()
+            if pbxProjHash != unchangedHash:
+                os.fsync(file.fileno())
+        if pbxProjHash == unchangedHash:
+            os.unlink(temporaryPath)
+            return pbxProjHash
+        os.chmod(temporaryPath, mode)
+        os.replace(temporaryPath, filename)
+    except BaseException:
+        try:
+            os.unlink(temporaryPath)
+        except OSError:
+            pass
+        raise
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+    except OSError:
+        pass
+    return pbxProjHash
+
+def prepareProjectOptions(project, options):
+    options = dict(options or {})
+    if options.get(PBXProjOptionStageHookKey) is not None:
+        stageHook = options[PBXProjOptionStageHookKey]
+        def hook(stage):
+            stage[PBXStageProjectKey] = project
+            stageHook(stage)
+        options[PBXProjOptionStageHookKey] = hook
+    return options
+
+def checkProject(project, options=None, diffs=None, findings=None):
+    options = prepareProjectOptions(project, options)
+    hook = options.get(PBXProjOptionStageHookKey)
+    filename = os.path.join(project, PBXProjFilename)
+    if findings is not None and options.get(PBXProjOptionStreamKey):
+        raise ValueError("Auditing needs the whole project.pbxproj in memory and cannot stream")
+    start = time.perf_counter()
+    cacheKey = generateCacheKey(generateCacheConfiguration(options))
+    cache = {}
+    if options.get(PBXProjOptionCacheKey, True) and findings is None:
+        cache = readCache(generateCachePath(project, options.get(PBXProjOptionCacheDirectoryKey)))
+    fresh = isCacheFresh(cache, cacheKey, os.stat(filename))
+    reportStage(hook, "readCache", start, 0, 1 if cache else 0)
+    if fresh:
+        return []
+    options[PBXProjOptionSlicesKey] = readCacheSlices(cache, cacheKey)
+    if options.get(PBXProjOptionStreamKey):
+        stream = preparePBXProjStream(filename, options)
+        if isCacheMatch(cache, cacheKey, stream[PBXStreamHashKey]):
+            return []
+        return checkPBXProjStream(filename, stream, options, diffs)
+    start = time.perf_counter()
+    text = readPBXProjFile(filename)
+    reportStage(hook, "readPBXProj", start, len(text), 1)
+    if isCacheMatch(cache, cacheKey, hashPBXProj([text])):
+        return []
+    return checkPBXProj(text, options, diffs, findings)
+
+def organizeProject(project, options=None, findings=None):
+    options = prepareProjectOptions(project, options)
+    hook = options.get(PBXProjOptionStageHookKey)
+    filename = os.path.join(project, PBXProjFilename)
+    prune = options.get(PBXProjOptionPruneKey, False)
+    if (findings is not None or prune) and options.get(PBXProjOptionStreamKey):
+        raise ValueError("Auditing needs the whole project.pbxproj in memory and cannot stream")
+    start = time.perf_counter()
+    cacheKey = generateCacheKey(generateCacheConfiguration(options))
+    cachePath = None
+    if options.get(PBXProjOptionCacheKey, True):
+        cachePath = generateCachePath(project, options.get(PBXProjOptionCacheDirectoryKey))
+    cache = readCache(cachePath) if cachePath and (findings is None or prune) else {}
+    fresh = isCacheFresh(cache, cacheKey, os.stat(filename))
+    reportStage(hook, "readCache", start, 0, 1 if cache else 0)
+    if fresh:
+        return PBXProjStatusUnchanged
+    if cachePath:
+        slices = options.setdefault(PBXProjOptionSlicesKey, {})
+        if not slices:
+            slices.update(readCacheSlices(cache, cacheKey))
+    if options.get(PBXProjOptionStreamKey):
+        stream = preparePBXProjStream(filename, options)
+        pbxProjHash = organizedHash = stream[PBXStreamHashKey]
+        if not isCacheMatch(cache, cacheKey, pbxProjHash):
+            start = time.perf_counter()
+            organizedHash = writePBXProjFile(filename, organizePBXProjStream(filename, stream, options), pbxProjHash)
+            reportStage(hook, "writePBXProj", start, 0, 1)
+    else:
+        start = time.perf_counter()
+        text = readPBXProjFile(filename)
+        pbxProjHash = hashPBXProj([text])
+        reportStage(hook, "readPBXProj", start, len(text), 1)
+        if isCacheMatch(cache, cacheKey, pbxProjHash):
+            pieces = [text]
+        else:
+            pieces = organizePBXProj(text, options, findings)
+        start = time.perf_counter()
+        organizedHash = hashPBXProj(pieces)
+        if organizedHash != pbxProjHash:
+            writePBXProjFile(filename, pieces)
+        reportStage(hook, "writePBXProj", start, len(text), len(pieces))
+    status = PBXProjStatusUnchanged if organizedHash == pbxProjHash else PBXProjStatusOrganized
+    if cachePath:
+        writeCache(cachePath, cacheKey, os.stat(filename), organizedHash, options.get(PBXProjOptionSlicesKey))
+    return status
+
+def organizeProjectResult(project, options=None):
+    options = dict(options or {})
+    result = {
+        PBXProjResultProjectKey : project
+    }
+    if options.get(PBXProjOptionProfileKey):
+        stages = []
+        hook = options.get(PBXProjOptionStageHookKey)
+        def profileHook(stage):
+            stages.append(stage)
+            if hook is not None:
+                hook(stage)
+        options[PBXProjOptionStageHookKey] = profileHook
+        result[PBXProjResultStagesKey] = stages
+    start = time.perf_counter()
+    try:
+        if not os.path.isdir(project):
+            raise ValueError("No such directory" if not os.path.exists(project) else "Not a directory")
+        findings = None
+        if options.get(PBXProjOptionAuditKey) or options.get(PBXProjOptionPruneKey):
+            findings = result[PBXProjResultFindingsKey] = []
+        if options.get(PBXProjOptionCheckKey):
+            diffs = None
+            if options.get(PBXProjOptionDiffKey):
+                diffs = result[PBXProjResultDiffsKey] = []
+            result[PBXProjResultSectionsKey] = checkProject(project, options, diffs, findings)
+            result[PBXProjResultStatusKey] = PBXProjStatusUnorganized if result[PBXProjResultSectionsKey] else PBXProjStatusUnchanged
+        else:
+            result[PBXProjResultStatusKey] = organizeProject(project, options, findings)
+    except Exception as error:
+        result[PBXProjResultStatusKey] = PBXProjStatusFailed
+        result[PBXProjResultErrorKey] = str(error) or error.__class__.__name__
+    result[PBXProjResultElapsedKey] = time.perf_counter() - start
+    try:
+        result[PBXProjResultBytesKey] = os.path.getsize(os.path.join(project, PBXProjFilename))
+    except OSError:
+        pass
+    return result
+
+def organizeProjects(projects, options=None, jobs=1):
+    import itertools
+    projects = iter(projects)
+    first = list(itertools.islice(projects, 2))
+    if jobs == 1 or len(first) < 2:
+        for project in itertools.chain(first, projects):
+            yield organizeProjectResult(project, options)
+        return
+    import collections
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = collections.deque()
+        try:
+            for project in itertools.chain(first, projects):
+                futures.append(executor.submit(organizeProjectResult, project, options))
+                while futures and futures[0].done():
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def summarizeProjectResult(summary, result):
+    status = result[PBXProjResultStatusKey]
+    summary[PBXProjSummaryProjectsKey] = summary.get(PBXProjSummaryProjectsKey, 0) + 1
+    summary[status] = summary.get(status, 0) + 1
+    summary[PBXProjResultBytesKey] = summary.get(PBXProjResultBytesKey, 0) + result.get(PBXProjResultBytesKey, 0)
+    for diff in result.get(PBXProjResultDiffsKey, []):
+        moves = summary.setdefault(PBXProjSummaryMovesKey, {})
+        moves[diff[PBXDiffSectionKey]] = moves.get(diff[PBXDiffSectionKey], 0) + diff[PBXDiffMovesKey]
+    for finding in result.get(PBXProjResultFindingsKey, []):
+        kinds = summary.setdefault(PBXProjSummaryFindingsKey, {})
+        kinds[finding[PBXFindingKindKey]] = kinds.get(finding[PBXFindingKindKey], 0) + 1
+    return summary
+
+##### Watch #####
 
-# print "---------- STARTING PYTHON ----------"
+### Functions
 
-# Obtain .xcodeproj files
+def readPBXProjSignature(project):
+    try:
+        status = os.stat(os.path.join(project, PBXProjFilename))
+    except OSError:
+        return None
+    return (status.st_mtime_ns, status.st_size, status.st_ino)
+
+def watchProjects(projects, options=None, interval=0.5, debounce=1.0):
+    seen = {}
+    pending = {}
+    projectOptions = {}
+    for project in projects:
+        projectOptions[project] = dict(options or {})
+        projectOptions[project][PBXProjOptionSlicesKey] = {}
+        result = organizeProjectResult(project, projectOptions[project])
+        seen[project] = readPBXProjSignature(project)
+        yield result
+    while True:
+        time.sleep(interval)
+        for project in projects:
+            signature = readPBXProjSignature(project)
+            if signature is None or signature == seen[project]:
+                pending.pop(project, None)
+                continue
+            now = time.monotonic()
+            if project not in pending or pending[project][0] != signature:
+                pending[project] = (signature, now)
+                continue
+            if now - pending[project][1] < debounce:
+                continue
+            del pending[project]
+            result = organizeProjectResult(project, projectOptions[project])
+            seen[project] = readPBXProjSignature(project)
+            yield result
+
+##### Merge Driver #####
 
-projects = glob.glob("*.xcodeproj")
+### Constants
 
-for project in projects:
+PBXMergeListKeys = [PBXGroupSectionChildrenKey, PBXBuildPhaseFilesKey]
+PBXMergeItemSeparator = "\n\t\t\t\t"
+PBXMergeObjectSeparator = "\n\t\t"
+PBXMergeSectionSeparator = "\n\n"
 
-    # Input
+### Regexes
 
-    filename = project + "/project.pbxproj"
-    file = open(filename, "r+")
-    text = "".join(file)
+PBXMergeListRegexes = dict((key, re.compile(r"(?<![\w.\"])" + key + r"\s*=\s*\(")) for key in PBXMergeListKeys)
+# 0 = PBXObject list key through the opening parenthesis
 
-    # Processing
+### Functions
+
+def readPBXProjTable(text):
+    sections = indexPBXProjSections(text)
+    if len(sections) == 0:
+        raise ValueError("No object sections in pbxproj")
+    parsePBXProj(text, sections)
+    objects = {}
+    for name, section in sections.items():
+        for object in section[PBXSectionObjectsKey]:
+            objects[object[PBXObjectIdKey]] = (text, name, object)
+    return sections, objects
+
+def objectText(entry):
+    if entry is None:
+        return None
+    text, name, object = entry
+    return text[object[PBXObjectStartKey]:object[PBXObjectEndKey]]
+
+def frameText(text, sections):
+    start = min(section[PBXSectionStartKey] for section in sections.values())
+    end = max(section[PBXSectionEndKey] for section in sections.values())
+    return (text[:start], text[end:])
+
+def mergePBXProjList(base, ours, theirs):
+    base = set(base)
+    theirsSet = set(theirs)
+    merged = [item for item in ours if item in theirsSet or item not in base]
+    oursSet = set(ours)
+    merged.extend(item for item in theirs if item not in base and item not in oursSet)
+    return merged
+
+def mergePBXProjObject(objectId, base, ours, theirs):
+    baseText, oursText, theirsText = objectText(base), objectText(ours), objectText(theirs)
+    if oursText == theirsText or theirsText == baseText:
+        return oursText
+    if oursText == baseText:
+        return theirsText
+    if ours is None or theirs is None:
+        raise ValueError("Conflicting changes to object %s" % objectId)
+    values = [entry[2][PBXObjectValueKey] if entry else {} for entry in (base, ours, theirs)]
+    scalars = [dict((key, value[key]) for key in value if key not in PBXMergeListKeys) for value in values]
+    if scalars[1] == scalars[2] or scalars[2] == scalars[0]:
+        template, other, value = ours, theirs, values[1]
+    elif scalars[1] == scalars[0]:
+        template, other, value = theirs, ours, values[2]
+    else:
+        raise ValueError("Conflicting changes to object %s" % objectId)
+    text, name, object = template
+    edits = []
+    for key in PBXMergeListKeys:
+        lists = [value.get(key, []) for value in values]
+        if not all(isinstance(items, list) for items in lists):
+            raise ValueError("Conflicting changes to object %s" % objectId)
+        merged = mergePBXProjList(*lists)
+        if merged == value.get(key, []):
+            continue
+        itemTexts = {}
+        separator = None
+        for entry in (template, other):
+            entryValue = entry[2][PBXObjectValueKey].get(key, [])
+            spans = entry[2][PBXObjectItemsKey].get(key, [])
+            for item, span in zip(entryValue, spans):
+                itemTexts.setdefault(item, entry[0][span[0]:span[1]])
+            if separator is None and len(spans) > 1:
+                separator = entry[0][spans[0][1]:spans[1][0]]
+        separator = separator or PBXMergeItemSeparator
+        items = [itemText if itemText.endswith(",") else itemText + "," for itemText in (itemTexts[item] for item in merged)]
+        spans = object[PBXObjectItemsKey].get(key, [])
+        if len(spans) > 0:
+            start = spans[0][0] if len(merged) > 0 else text.rfind("(", object[PBXObjectStartKey], spans[0][0]) + 1
+            edits.append((start, spans[-1][1], separator.join(items)))
+        else:
+            matches = list(PBXMergeListRegexes[key].finditer(text, object[PBXObjectStartKey], object[PBXObjectEndKey]))
+            if len(matches) != 1:
+                raise ValueError("Conflicting changes to object %s" % objectId)
+            edits.append((matches[0].end(), matches[0].end(), separator + separator.join(items)))
+    pieces = []
+    position = object[PBXObjectStartKey]
+    for start, end, replacement in sorted(edits):
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:object[PBXObjectEndKey]])
+    return "".join(pieces)
+
+def renderPBXProjSection(text, section, entries):
+    objects = section[PBXSectionObjectsKey]
+    if len(objects) == 0:
+        return "\t\t" + PBXMergeObjectSeparator.join(entries)
+    separator = PBXMergeObjectSeparator
+    if len(objects) > 1:
+        separator = text[objects[0][PBXObjectEndKey]:objects[1][PBXObjectStartKey]]
+    lead = text[section[PBXSectionBodyStartKey]:objects[0][PBXObjectStartKey]]
+    trail = text[objects[-1][PBXObjectEndKey]:section[PBXSectionBodyEndKey]]
+    return lead + separator.join(entries) + trail
+
+def mergePBXProj(baseText, oursText, theirsText):
+    baseSections, base = readPBXProjTable(baseText)
+    oursSections, ours = readPBXProjTable(oursText)
+    theirsSections, theirs = readPBXProjTable(theirsText)
+    edits = []
+    oursFrame = frameText(oursText, oursSections)
+    theirsFrame = frameText(theirsText, theirsSections)
+    baseFrame = frameText(baseText, baseSections)
+    if oursFrame != theirsFrame and theirsFrame != baseFrame:
+        if oursFrame != baseFrame:
+            raise ValueError("Conflicting changes outside the object sections")
+        edits.append((0, len(oursFrame[0]), theirsFrame[0]))
+        edits.append((len(oursText) - len(oursFrame[1]), len(oursText), theirsFrame[1]))
+    resolved = {}
+    for objectId in set(ours).union(theirs):
+        resolved[objectId] = mergePBXProjObject(objectId, base.get(objectId), ours.get(objectId), theirs.get(objectId))
+    additions = {}
+    for objectId in theirs:
+        if objectId not in ours and resolved[objectId] is not None:
+            additions.setdefault(theirs[objectId][1], []).append(objectId)
+    for name, section in oursSections.items():
+        objects = section[PBXSectionObjectsKey]
+        entries = [(object[PBXObjectIdKey], resolved[object[PBXObjectIdKey]]) for object in objects]
+        entries = [entry for entry in entries if entry[1] is not None]
+        changed = len(entries) != len(objects) or any(entry[1] != objectText(ours[entry[0]]) for entry in entries)
+        if name in additions:
+            ids = [entry[0] for entry in entries]
+            entries.extend((objectId, resolved[objectId]) for objectId in additions[name])
+            if ids == sorted(ids):
+                entries.sort()
+            changed = True
+        if not changed:
+            continue
+        if len(entries) == 0:
+            edits.append((max(section[PBXSectionStartKey] - 1, 0), min(section[PBXSectionEndKey] + 1, len(oursText)), ""))
+        else:
+            edits.append((section[PBXSectionBodyStartKey], section[PBXSectionBodyEndKey], renderPBXProjSection(oursText, section, [entry[1] for entry in entries])))
+    names = sorted(oursSections, key=lambda x: oursSections[x][PBXSectionStartKey])
+    for name in sorted(additions):
+        if name in oursSections:
+            continue
+        section = theirsSections[name]
+        body = renderPBXProjSection(theirsText, section, [resolved[objectId] for objectId in additions[name]])
+        sectionText = theirsText[section[PBXSectionStartKey]:section[PBXSectionBodyStartKey]] + body + theirsText[section[PBXSectionBodyEndKey]:section[PBXSectionEndKey]]
+        following = [x for x in names if x > name]
+        if len(following) > 0:
+            position = oursSections[following[0]][PBXSectionStartKey]
+            edits.append((position, position, sectionText + PBXMergeSectionSeparator))
+        else:
+            position = oursSections[names[-1]][PBXSectionEndKey]
+            edits.append((position, position, PBXMergeSectionSeparator + sectionText))
+    pieces = []
+    position = 0
+    for start, end, replacement in sorted(edits, key=lambda x: x[0:2]):
+        pieces.append(oursText[position:start])
+        pieces.append(replacement)
+        position = max(position, end)
+    pieces.append(oursText[position:])
+    return "".join(pieces)
+
+def mergeProjectFiles(basePath, oursPath, theirsPath, options=None):
+    texts = [readPBXProjFile(path) for path in (basePath, oursPath, theirsPath)]
+    try:
+        merged = organizeText(mergePBXProj(*texts), options)
+    except ValueError:
+        import subprocess
+        return subprocess.call(["git", "merge-file", "-L", "ours", "-L", "base", "-L", "theirs", oursPath, basePath, theirsPath]) == 0
+    writePBXProjFile(oursPath, [merged])
+    return True
+
+########## SCRIPT ##########
 
-    order = processPBXProjOrder(text)
+##### Code
+
+def mergeDriverMain(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="pbxproj_organizer.py merge-driver", description="Merge and organize a project.pbxproj as a git merge driver.")
+    parser.add_argument("base", help="common ancestor version (%%O)")
+    parser.add_argument("ours", help="current version, which receives the result (%%A)")
+    parser.add_argument("theirs", help="other branch's version (%%B)")
+    parser.add_argument("path", nargs="?", help="path of the merged file in the repository (%%P)")
+    parser.add_argument("--order", default=PBXOrderStrategyTree, metavar="STRATEGY", help="order of the children of each group, as for organizing (default: %s)" % PBXOrderStrategyTree)
+    parser.add_argument("--prune", action="store_true", help="remove orphaned objects and duplicate build phase files from the merged project")
+    arguments = parser.parse_args(argv)
+    try:
+        resolveOrderStrategy(arguments.order)
+    except (ImportError, AttributeError, ValueError) as error:
+        parser.error("--order: %s" % error)
+
+    options = {
+        PBXProjOptionOrderKey : arguments.order,
+        PBXProjOptionPruneKey : arguments.prune
+    }
 
-    text = updatePBXBuildFileSection(text, order)
-    text = updatePBXFileReferenceSection(text, order)
-    text = updatePBXFrameworksBuildPhaseSection(text, order)
-    text = updatePBXGroupSection(text, order)
-    text = updatePBXResourcesBuildPhaseSection(text, order)
-    text = updatePBXSourcesBuildPhaseSection(text, order)
+    return 0 if mergeProjectFiles(arguments.base, arguments.ours, arguments.theirs, options) else 1
+
+def main(argv=None):
+    import argparse
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["merge-driver"]:
+        return mergeDriverMain(argv[1:])
+
+    # print "---------- STARTING PYTHON ----------"
+
+    # Arguments
+
+    parser = argparse.ArgumentParser(description="Organize the project.pbxproj file of each .xcodeproj found in the given directories.")
+    parser.add_argument("paths", nargs="*", default=["."], help="directories to search, or .xcodeproj bundles to organize; '-' reads more of them from standard input, one per line (default: current directory)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="search the directories recursively, following .xcworkspace references")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN", help="skip directories matching this .gitignore-style pattern while searching")
+    parser.add_argument("--exclude-from", action="append", default=[], metavar="FILE", help="read exclude patterns from FILE")
+    parser.add_argument("--cache-dir", help="store organizer cache files in this directory instead of each project's xcuserdata")
+    parser.add_argument("--no-cache", action="store_true", help="read and organize every project even if it is unchanged since the last run")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="organize up to N projects in parallel (0 = one per CPU)")
+    parser.add_argument("--check", action="store_true", help="report projects that are not organized without writing them, and exit non-zero if any are found")
+    parser.add_argument("--diff", action="store_true", help="like --check, but print a unified diff of the lines each unorganized section would reorder, and report how many objects or files move in each")
+    parser.add_argument("--audit", action="store_true", help="report orphaned PBXBuildFile and PBXFileReference objects and duplicate build phase files")
+    parser.add_argument("--prune", action="store_true", help="remove orphaned PBXBuildFile and PBXFileReference objects and duplicate build phase files, and report them")
+    parser.add_argument("--order", default=PBXOrderStrategyTree, metavar="STRATEGY", help="order of the children of each group, which every section follows: %s, or module:function for a key function that gets each child's object (default: %s)" % (", ".join(sorted(PBXOrderStrategies)), PBXOrderStrategyTree))
+    parser.add_argument("--stream", action="store_true", help="read each project.pbxproj one section at a time to reduce peak memory on very large projects")
+    parser.add_argument("--fail-fast", action="store_true", help="stop at the first project that fails or is not organized, and at its first unorganized section")
+    parser.add_argument("--watch", action="store_true", help="keep running and reorganize projects whenever they change")
+    parser.add_argument("--interval", type=float, default=0.5, metavar="SECONDS", help="how often --watch polls for changes (default: 0.5)")
+    parser.add_argument("--debounce", type=float, default=1.0, metavar="SECONDS", help="how long a change must settle before --watch reorganizes (default: 1.0)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per project, then a summary object, instead of text")
+    parser.add_argument("--profile", action="store_true", help="print wall time, bytes and element counts for each organizer stage")
+    parser.add_argument("--trace", metavar="FILE", help="write organizer stages to FILE in Chrome trace-event format")
+    arguments = parser.parse_args(argv)
+    if (arguments.check or arguments.diff) and arguments.watch:
+        parser.error("--check and --diff cannot be used with --watch")
+    if arguments.prune and (arguments.check or arguments.diff):
+        parser.error("--prune cannot be used with --check or --diff")
+    if (arguments.audit or arguments.prune) and arguments.stream:
+        parser.error("--audit and --prune cannot be used with --stream")
+    try:
+        resolveOrderStrategy(arguments.order)
+    except (ImportError, AttributeError, ValueError) as error:
+        parser.error("--order: %s" % error)
+
+    options = {
+        PBXProjOptionCacheKey : not arguments.no_cache,
+        PBXProjOptionCacheDirectoryKey : arguments.cache_dir,
+        PBXProjOptionProfileKey : arguments.profile or arguments.trace is not None,
+        PBXProjOptionCheckKey : arguments.check or arguments.diff,
+        PBXProjOptionDiffKey : arguments.diff,
+        PBXProjOptionAuditKey : arguments.audit,
+        PBXProjOptionPruneKey : arguments.prune,
+        PBXProjOptionOrderKey : arguments.order,
+        PBXProjOptionFailFastKey : arguments.fail_fast,
+        PBXProjOptionStreamKey : arguments.stream
+    }
+    jobs = arguments.jobs if arguments.jobs > 0 else (os.cpu_count() or 1)
+
+    # Obtain .xcodeproj files
 
-    # Save To File
+    patterns = list(arguments.exclude)
+    for filename in arguments.exclude_from:
+        patterns.extend(readExcludePatterns(filename))
+    excludes = compileExcludePatterns(patterns)
+    projects = discoverProjects(readRoots(arguments.paths), excludes, arguments.recursive)
 
-    file.seek(0)
-    file.write(text)
-    file.truncate()
-    file.close()
+    # Processing
 
-# print "---------- PYTHON COMPLETE ----------"
+    start = time.perf_counter()
+    if arguments.watch:
+        results = watchProjects(list(projects), options, arguments.interval, arguments.debounce)
+    else:
+        results = organizeProjects(projects, options, jobs)
+    failures = 0
+    interrupted = False
+    stages = []
+    summary = {}
+    try:
+        for result in results:
+            if result[PBXProjResultStatusKey] in [PBXProjStatusFailed, PBXProjStatusUnorganized]:
+                failures += 1
+            summarizeProjectResult(summary, result)
+            if arguments.json:
+                print(json.dumps(result, sort_keys=True))
+                sys.stdout.flush()
+            elif result[PBXProjResultStatusKey] == PBXProjStatusFailed:
+                sys.stderr.write(result[PBXProjResultProjectKey] + ": failed: " + result[PBXProjResultErrorKey] + "\n")
+            elif result[PBXProjResultStatusKey] == PBXProjStatusUnorganized and arguments.diff:
+                sys.stdout.write(formatPBXProjDiff(os.path.join(result[PBXProjResultProjectKey], PBXProjFilename), result[PBXProjResultDiffsKey]))
+                sys.stderr.write(result[PBXProjResultProjectKey] + ": unorganized: " + ", ".join("%s (%d moves)" % (diff[PBXDiffSectionKey], diff[PBXDiffMovesKey]) for diff in result[PBXProjResultDiffsKey]) + "\n")
+            elif result[PBXProjResultStatusKey] == PBXProjStatusUnorganized:
+                print(result[PBXProjResultProjectKey] + ": unorganized: " + ", ".join(result[PBXProjResultSectionsKey]))
+            elif arguments.diff:
+                sys.stderr.write(result[PBXProjResultProjectKey] + ": " + result[PBXProjResultStatusKey] + "\n")
+            else:
+                print(result[PBXProjResultProjectKey] + ": " + result[PBXProjResultStatusKey])
+            if not arguments.json:
+                for finding in result.get(PBXProjResultFindingsKey, []):
+                    (sys.stderr if arguments.diff else sys.stdout).write("  " + ("pruned " if arguments.prune else "") + formatFinding(finding) + "\n")
+            if arguments.profile and not arguments.json:
+                for line in formatStages(result[PBXProjResultStagesKey]):
+                    print(line)
+            stages.extend(result.get(PBXProjResultStagesKey, []))
+            if arguments.fail_fast and failures > 0:
+                break
+    except KeyboardInterrupt:
+        # Ctrl-C is how --watch ends; any other run stopped before it has every result
+        interrupted = not arguments.watch
+    if arguments.json:
+        summary[PBXProjResultElapsedKey] = time.perf_counter() - start
+        print(json.dumps({PBXProjSummaryKey : summary}, sort_keys=True))
+
+    # Trace
+
+    if arguments.trace is not None:
+        with open(arguments.trace, "w") as file:
+            json.dump(generateChromeTrace(stages), file)
+
+    # print "---------- PYTHON COMPLETE ----------"
+
+    if interrupted:
+        return 130
+    return 1 if failures > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())